@@ -0,0 +1,96 @@
+from rate_limiter import estimate_tokens
+
+# Бюджеты одного батч-запроса в токенах. Выходной лимит модели — главный ограничитель:
+# если ответ не помещается, JSON обрезается и батч уходит в поштучный fallback.
+DEFAULT_INPUT_BUDGET = 100_000
+DEFAULT_OUTPUT_BUDGET = 32_000
+
+# Служебные токены на один элемент: номер, двоеточие, кавычки и запятая в JSON
+ITEM_OVERHEAD_TOKENS = 8
+
+# Во сколько раз перевод (RU) длиннее исходника в токенах — начальная оценка,
+# дальше уточняется по usage_metadata ответов
+DEFAULT_OUTPUT_RATIO = 2.0
+
+# Бюджет не опускается ниже этой доли от исходного
+MIN_BUDGET_FRACTION = 1 / 32
+
+# Шаг восстановления бюджета после успешного ответа — доля от исходного (аддитивный рост AIMD)
+BUDGET_STEP_FRACTION = 1 / 16
+
+
+class BatchPacker:
+    """Набирает батчи по оценке входных и выходных токенов, а не по числу строк.
+    Учится на ответах по схеме AIMD: обрезанный/неудачный ответ вдвое уменьшает выходной бюджет,
+    каждый успешный ответ прибавляет к нему BUDGET_STEP_FRACTION исходного.
+    log(message) — куда писать сообщения об изменении бюджета (по умолчанию print).
+    """
+
+    def __init__(self, input_budget: int = DEFAULT_INPUT_BUDGET, output_budget: int = DEFAULT_OUTPUT_BUDGET,
+                 max_items: int = 10000, log=print):
+        self.input_budget = input_budget
+        self.base_output_budget = output_budget
+        self.output_budget = output_budget
+        self.min_output_budget = max(ITEM_OVERHEAD_TOKENS * 4, int(output_budget * MIN_BUDGET_FRACTION))
+        self.max_items = max(1, max_items)
+        self.output_ratio = DEFAULT_OUTPUT_RATIO
+        self.log = log
+
+    def input_cost(self, text: str) -> int:
+        return estimate_tokens(text) + ITEM_OVERHEAD_TOKENS
+
+    def output_cost(self, text: str) -> int:
+        return int(estimate_tokens(text) * self.output_ratio) + ITEM_OVERHEAD_TOKENS
+
+    def take(self, items: list[tuple[int, str]], start: int) -> int:
+        """Возвращает конец среза items[start:end], который помещается в бюджеты.
+        В батч всегда попадает хотя бы один элемент.
+        """
+        in_total = 0
+        out_total = 0
+        end = start
+        limit = min(len(items), start + self.max_items)
+        while end < limit:
+            text = items[end][1]
+            in_total += self.input_cost(text)
+            out_total += self.output_cost(text)
+            if end > start and (in_total > self.input_budget or out_total > self.output_budget):
+                break
+            end += 1
+        return end
+
+    def estimate_output(self, chunk: list[tuple[int, str]]) -> int:
+        return sum(self.output_cost(text) for _, text in chunk)
+
+    def on_success(self, estimated_output: int = 0, actual_output: int = 0):
+        """Полный ответ: уточняем коэффициент выхода и понемногу возвращаем бюджет."""
+        if estimated_output and actual_output:
+            observed = self.output_ratio * actual_output / estimated_output
+            # Плавное усреднение, чтобы один нетипичный ответ не раскачивал оценку
+            self.output_ratio = max(0.5, min(8.0, 0.8 * self.output_ratio + 0.2 * observed))
+        if self.output_budget < self.base_output_budget:
+            step = max(1, int(self.base_output_budget * BUDGET_STEP_FRACTION))
+            self.output_budget = min(self.base_output_budget, self.output_budget + step)
+
+    def on_truncated(self):
+        """Ответ обрезан или не разобран — батч был слишком большим для модели."""
+        new_budget = max(self.min_output_budget, self.output_budget // 2)
+        if new_budget < self.output_budget:
+            self.log(f'Уменьшаю бюджет батча по выходным токенам: {self.output_budget} -> {new_budget}.')
+        self.output_budget = new_budget
+
+    def on_rate_limited(self):
+        """Батч не прошёл из-за 429 — крупные запросы сильнее бьют по TPM, дробим мельче."""
+        self.on_truncated()
+
+    def feedback(self, truncated: bool, saw_429: bool, success: bool, estimated_output: int = 0,
+                 actual_output: int = 0):
+        """Подстраивает бюджет по исходу батча (как его возвращает BatchRequester.translate_chunk):
+        обрезанный ответ или 429 без полного перевода уменьшают бюджет, полный перевод — возвращает его.
+        """
+        if truncated:
+            self.on_truncated()
+        elif saw_429 and not success:
+            self.on_rate_limited()
+        elif success:
+            self.on_success(estimated_output, actual_output)
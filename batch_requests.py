@@ -0,0 +1,372 @@
+import json
+import re
+import time
+
+from pydantic import BaseModel
+
+from metrics import metrics
+from rate_limiter import limiter, concurrency, estimate_tokens, is_rate_limit_error, retry_delay_from_error
+from rpgm_extract import placeholders_match
+
+# Батчевые запросы перевода по JSON-схеме — общие для rpgmaker_translator_lastV.py и GUI (main.py):
+# отправка через общий лимитер, повторы после 429 и ошибок, проверка элементов ответа,
+# досылка недостающих индексов и отдельные запросы на последние строки.
+# Тексты инструкций у каждой точки входа свои и передаются в BatchRequester.
+
+# Сколько раз повторять батч после 429 (паузы растут экспоненциально, см. rate_limiter.backoff_delay)
+# и после прочих ошибок
+RATE_LIMIT_RETRIES = 5
+ERROR_RETRIES = 1
+
+# Сколько раз досылать недостающие в ответе индексы (каждый раз батчами вдвое меньше)
+# и при каком остатке переходить к отдельным запросам на строку
+SALVAGE_ROUNDS = 3
+PER_ITEM_FALLBACK_MAX = 20
+
+# Задержки каких запросов учитывает окно параллельности (concurrency.on_success): только полноразмерных
+# батчей. Досылки и отдельные строки отвечают гораздо быстрее и занизили бы базовую задержку —
+# после них обычные батчи казались бы медленными и окно переставало бы расти.
+LATENCY_KINDS = ('batch', 'combined')
+
+# Начало массива items в JSON-ответе и разделители между его элементами (для оборванных ответов)
+_items_start = re.compile(r'"items"\s*:\s*\[')
+_item_separator = re.compile(r'[\s,]*')
+_decoder = json.JSONDecoder()
+
+
+class TranslationCancelled(Exception):
+    """Перевод отменён (установлен cancel у BatchRequester)."""
+
+
+class TranslationItem(BaseModel):
+    index: int
+    translation: str
+
+
+class BatchTranslations(BaseModel):
+    """Схема ответа батчевого запроса: перевод на каждый индекс входа."""
+    items: list[TranslationItem]
+
+
+class LanguageTranslation(BaseModel):
+    lang: str
+    translation: str
+
+
+class MultiTranslationItem(BaseModel):
+    index: int
+    translations: list[LanguageTranslation]
+
+
+class MultiBatchTranslations(BaseModel):
+    """Схема ответа совмещённого запроса: на каждый индекс входа — переводы на все языки запроса."""
+    items: list[MultiTranslationItem]
+
+
+def _json_items(text) -> list | None:
+    """Элементы массива items из JSON-ответа {"items": [...]}.
+    Ответ, оборванный посреди JSON (обычно по лимиту выходных токенов), разбирается по одному элементу
+    (JSONDecoder.raw_decode): возвращаются все элементы, полностью дошедшие до обрыва.
+    None — массива items в ответе нет.
+    """
+    if not isinstance(text, str):
+        return None
+    try:
+        j = json.loads(text)
+    except ValueError:
+        pass
+    else:
+        return j['items'] if isinstance(j, dict) and isinstance(j.get('items'), list) else None
+    start = _items_start.search(text)
+    if start is None:
+        return None
+    items = []
+    pos = start.end()
+    while True:
+        pos = _item_separator.match(text, pos).end()
+        if pos >= len(text) or text[pos] == ']':
+            break
+        try:
+            item, pos = _decoder.raw_decode(text, pos)
+        except ValueError:
+            # Элемент оборван (или испорчен) — дальше разбирать нечего
+            break
+        items.append(item)
+    return items
+
+
+def structured_items(response) -> list[tuple] | None:
+    """Пары (index, translation) из ответа со схемой BatchTranslations.
+    Берём response.parsed от SDK (если бэкенд его дал), иначе разбираем response.text как JSON той же формы;
+    из оборванного ответа берутся все элементы до обрыва (см. _json_items).
+    None — ответ не разобран.
+    """
+    try:
+        parsed = response.parsed
+    except Exception:
+        parsed = None
+    if parsed is not None and getattr(parsed, 'items', None) is not None:
+        return [(getattr(it, 'index', None), getattr(it, 'translation', None)) for it in parsed.items]
+    items = _json_items(response.text)
+    if items is None:
+        return None
+    return [(it.get('index'), it.get('translation')) for it in items if isinstance(it, dict)]
+
+
+def structured_multi_items(response) -> list[tuple] | None:
+    """Пары (index, {язык: перевод}) из ответа со схемой MultiBatchTranslations
+    (оборванный ответ — как в structured_items); None — ответ не разобран."""
+    try:
+        parsed = response.parsed
+    except Exception:
+        parsed = None
+    if parsed is not None and getattr(parsed, 'items', None) is not None:
+        return [(getattr(it, 'index', None),
+                 {getattr(t, 'lang', None): getattr(t, 'translation', None) for t in (getattr(it, 'translations', None) or [])})
+                for it in parsed.items]
+    items = _json_items(response.text)
+    if items is None:
+        return None
+    return [(it.get('index'), {t.get('lang'): t.get('translation') for t in (it.get('translations') or [])
+                               if isinstance(t, dict)})
+            for it in items if isinstance(it, dict)]
+
+
+def _numbered(chunk: list[tuple[int, str]]) -> str:
+    """Строки чанка в виде 'index: text' — так их видит модель."""
+    return "\n".join(f"{idx}: {text}" for idx, text in chunk)
+
+
+def accept(index, translation, chunk_texts: dict[int, str]) -> str | None:
+    """Проверенный перевод элемента ответа: индекс из чанка, непустой текст, те же плейсхолдеры {n}.
+    None — перевод отклонён.
+    """
+    if (not isinstance(translation, str) or not translation.strip()
+            or not placeholders_match(chunk_texts[index], translation)):
+        return None
+    return translation.strip()
+
+
+class BatchRequester:
+    """Запросы перевода одного прогона к бэкенду backend (модель model).
+    batch_instruction(lang) — инструкция батча, за ней идут строки 'index: text';
+    single_prompt(text, lang) — запрос на одну строку (последнее средство для упрямых строк);
+    multi_instruction(languages) — инструкция совмещённого запроса на несколько языков (request_multi);
+    log(message) — куда писать диагностику (по умолчанию print);
+    cancel — threading.Event: после его установки новые запросы не отправляются,
+    а ожидание квоты прерывается (TranslationCancelled).
+    Сам объект состояния не меняет, поэтому методы можно вызывать из рабочих потоков параллельно.
+    """
+
+    def __init__(self, backend, model: str, batch_instruction, single_prompt, log=print, cancel=None,
+                 multi_instruction=None):
+        self.backend = backend
+        self.model = model
+        self.batch_instruction = batch_instruction
+        self.single_prompt = single_prompt
+        self.multi_instruction = multi_instruction
+        self.log = log
+        self.cancel = cancel
+
+    def call(self, contents: str, schema=None, kind: str = 'batch'):
+        """Один запрос к бэкенду через общий лимитер с учётом метрик
+        (kind — batch, salvage, combined или single). Исходы запроса подстраивают паузы лимитера
+        и окно параллельности concurrency. Исключения пробрасываются вызывающему.
+        """
+        if self.cancel is not None and self.cancel.is_set():
+            raise TranslationCancelled()
+        tokens = estimate_tokens(contents)
+        started = time.perf_counter()
+        if not limiter.acquire(tokens, cancel=self.cancel):
+            raise TranslationCancelled()
+        sent = time.perf_counter()
+        metrics.inc('limiter_wait_seconds', sent - started)
+        metrics.inc('requests')
+        metrics.inc(kind + '_requests')
+        metrics.inc('tokens_sent', tokens)
+        try:
+            response = self.backend.generate(self.model, contents, schema=schema)
+        except Exception as e:
+            metrics.observe('request_latency_seconds', time.perf_counter() - sent)
+            if is_rate_limit_error(e):
+                metrics.inc('rate_limited')
+                # Лимитер придержит все потоки на паузу с джиттером, окно параллельности сужается
+                metrics.inc('backoff_seconds', limiter.penalize(retry_delay_from_error(e)))
+                if concurrency.on_rate_limited():
+                    metrics.inc('concurrency_decreases')
+            else:
+                metrics.inc('request_errors')
+            raise
+        latency = time.perf_counter() - sent
+        metrics.observe('request_latency_seconds', latency)
+        limiter.on_success()
+        if kind in LATENCY_KINDS:
+            concurrency.on_success(latency)
+        metrics.inc('tokens_received', response.output_tokens)
+        if response.truncated:
+            metrics.inc('truncated_responses')
+        return response
+
+    def send_with_retries(self, contents: str, schema, kind: str, start: int):
+        """Отправляет запрос: после 429 повторяет до RATE_LIMIT_RETRIES раз (с растущими паузами лимитера),
+        после прочих ошибок — ERROR_RETRIES раз. Возвращает (ответ или None, был ли 429).
+        """
+        saw_429 = False
+        limited = 0
+        errors = 0
+        while limited <= RATE_LIMIT_RETRIES and errors <= ERROR_RETRIES:
+            if limited or errors:
+                metrics.inc('retries')
+            try:
+                return self.call(contents, schema, kind), saw_429
+            except TranslationCancelled:
+                raise
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    # Пауза уже выставлена в лимитере: повтор дождётся её в acquire
+                    saw_429 = True
+                    limited += 1
+                    self.log(f'Получен 429 при батче (начиная с {start}), повтор {limited} после паузы...')
+                else:
+                    errors += 1
+                    self.log(f'Ошибка при переводе батча (начиная с {start}), попытка {errors}: {e}')
+        return None, saw_429
+
+    def check_items(self, response, items, chunk_texts: dict[int, str], languages: list[str],
+                    start: int) -> tuple[dict[int, dict[str, str]], bool]:
+        """Проверка элементов ответа, общая для request и request_multi.
+        items — пары (index, {язык: перевод}) или None (ответ не разобран). Принимаются только индексы
+        этого чанка, каждый один раз; перевод на каждый язык из languages проверяет accept.
+        Возвращает (по индексу — {язык: проверенный перевод}, был ли ответ обрезан/неполон).
+        """
+        truncated = bool(response.truncated)
+        if items is None:
+            # Неразбираемый ответ без массива items чаще всего означает обрыв в самом начале
+            truncated = True
+            items = []
+        results: dict[int, dict[str, str]] = {}
+        rejected = 0
+        for index, by_lang in items:
+            if not isinstance(index, int) or index not in chunk_texts or index in results:
+                continue
+            accepted = {}
+            for lang in languages:
+                translation = accept(index, by_lang.get(lang), chunk_texts)
+                if translation is None:
+                    rejected += 1
+                else:
+                    accepted[lang] = translation
+            results[index] = accepted
+        if rejected:
+            metrics.inc('items_rejected', rejected)
+            self.log(f'Батч (начиная с {start}): отклонено переводов с потерянными плейсхолдерами или пустых: {rejected}.')
+        if sum(len(v) for v in results.values()) + rejected < len(chunk_texts) * len(languages):
+            # Часть индексов потеряна — ответ неполный
+            truncated = True
+        return results, truncated
+
+    def request(self, chunk: list[tuple[int, str]], start: int, target_lang: str,
+                kind: str = 'batch') -> tuple[dict[int, str], bool, bool, bool, int]:
+        """Один батчевый запрос для пар (global_idx, text) на язык target_lang (с повторами, см. send_with_retries).
+        Ответ ограничен схемой BatchTranslations; каждый элемент проверяется (check_items): индекс из этого чанка,
+        непустой перевод, те же плейсхолдеры {n}, что в оригинале.
+        Возвращает (проверенные переводы по индексам, получен ли ответ, был ли 429,
+        был ли ответ обрезан/неполон, число выходных токенов).
+        Индексы, которых нет в ответе или которые не прошли проверку, просто отсутствуют в результате.
+        kind='salvage' — запрос досылки (только для метрик).
+        """
+        contents_payload = self.batch_instruction(target_lang) + _numbered(chunk)
+        response, saw_429 = self.send_with_retries(contents_payload, BatchTranslations, kind, start)
+        if response is None:
+            return {}, False, saw_429, False, 0
+
+        items = structured_items(response)
+        if items is not None:
+            items = [(index, {target_lang: translation}) for index, translation in items]
+        # Принимаем только индексы своего чанка: соседние чанки переводятся параллельно
+        checked, truncated = self.check_items(response, items, dict(chunk), [target_lang], start)
+        results = {index: by_lang[target_lang] for index, by_lang in checked.items() if by_lang}
+        # Ответ получен: недостающие индексы досылает translate_chunk меньшими батчами
+        return results, True, saw_429, truncated, response.output_tokens
+
+    def request_multi(self, chunk: list[tuple[int, str]], start: int,
+                      languages: list[str]) -> tuple[dict[int, dict[str, str]], bool, bool, bool, int]:
+        """Совмещённый запрос: переводит чанк сразу на несколько языков (схема MultiBatchTranslations,
+        инструкция multi_instruction). Проверка элементов та же, что в request (check_items).
+        Недостающие пары (индекс, язык) здесь не досылаются — их переводит вызывающий
+        обычными батчами этого языка.
+        Возвращает (по индексу — {язык: перевод}, был ли 429, получены ли все переводы,
+        был ли ответ обрезан/неполон, число выходных токенов).
+        """
+        contents_payload = self.multi_instruction(languages) + _numbered(chunk)
+        response, saw_429 = self.send_with_retries(contents_payload, MultiBatchTranslations, 'combined', start)
+        if response is None:
+            return {}, saw_429, False, False, 0
+
+        results, truncated = self.check_items(response, structured_multi_items(response), dict(chunk), languages, start)
+        complete = sum(len(v) for v in results.values()) == len(chunk) * len(languages)
+        return results, saw_429, complete, truncated, response.output_tokens
+
+    def translate_single(self, idx: int, text: str, target_lang: str) -> str:
+        """Последнее средство для упрямой строки: отдельный запрос.
+        Ответ проверяется так же, как элементы батча (accept): непустой, те же плейсхолдеры {n}.
+        При ошибке или отклонённом ответе — пустая строка: строка остаётся без перевода.
+        """
+        try:
+            reply = self.call(self.single_prompt(text, target_lang), kind='single').text
+        except TranslationCancelled:
+            raise
+        except Exception as e:
+            self.log(f'Не удалось перевести элемент {idx} по-отдельности: {e}')
+            return ''
+        translation = accept(idx, reply, {idx: text})
+        if translation is None:
+            metrics.inc('items_rejected')
+            self.log(f'Отдельный перевод элемента {idx} отклонён (пустой или с другими плейсхолдерами)')
+            return ''
+        return translation
+
+    def translate_chunk(self, chunk: list[tuple[int, str]], start: int,
+                        target_lang: str) -> tuple[dict[int, str], bool, bool, bool, int]:
+        """Переводит один чанк пар (global_idx, text) на язык target_lang.
+        Всё, что разобрано из ответа, сохраняется; недостающие индексы досылаются
+        повторными батчами вдвое меньшего размера (до SALVAGE_ROUNDS раз). Отдельные
+        запросы на строку — только если после этого осталось не больше PER_ITEM_FALLBACK_MAX строк;
+        иначе строки остаются без перевода.
+        Возвращает (переводы по глобальным индексам, был ли 429, переведён ли чанк батчами целиком,
+        был ли первый ответ обрезан/неполон, число выходных токенов всех ответов).
+        """
+        results, answered, saw_429, truncated, output_tokens = self.request(chunk, start, target_lang)
+        missing = [(idx, text) for idx, text in chunk if idx not in results]
+
+        # Без ответа (ошибки/429 на всех попытках) дробить батч бессмысленно — дело не в размере
+        piece_size = len(chunk)
+        rounds = SALVAGE_ROUNDS if answered else 0
+        for _ in range(rounds):
+            if not missing or not answered:
+                break
+            piece_size = max(1, min(len(missing), piece_size // 2))
+            self.log(f'Батч (начиная с {start}): получено {len(chunk) - len(missing)} из {len(chunk)}, '
+                     f'досылаю {len(missing)} по {piece_size}...')
+            for p in range(0, len(missing), piece_size):
+                piece = missing[p:p + piece_size]
+                piece_results, answered, piece_429, _, piece_tokens = self.request(piece, piece[0][0], target_lang,
+                                                                                   'salvage')
+                results.update(piece_results)
+                saw_429 = saw_429 or piece_429
+                output_tokens += piece_tokens
+                if not answered:
+                    break
+            missing = [(idx, text) for idx, text in missing if idx not in results]
+
+        success = not missing
+        if missing:
+            if len(missing) <= PER_ITEM_FALLBACK_MAX:
+                for idx, text in missing:
+                    translated = self.translate_single(idx, text, target_lang)
+                    if translated:
+                        results[idx] = translated
+            else:
+                self.log(f'Батч (начиная с {start}): {len(missing)} строк остались без перевода.')
+
+        return results, saw_429, success, truncated, output_tokens
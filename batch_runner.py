@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import rpgmaker_translator_lastV as translator
+from languages import parse_languages
+from metrics import metrics
+from rate_limiter import limiter, DEFAULT_RPM, DEFAULT_TPM
+from translation_log import missing_indices
+from translation_memory import MEMORY_FILENAME
+
+# Неинтерактивный перевод нескольких игр одним процессом (например, ночью на сборочной машине).
+# Вопросов на stdin нет: игры, категории и языки берутся из файла заданий и аргументов.
+# Все задания выполняются по очереди и делят один клиент API (translator.backend), общий лимитер
+# и окно параллельности (rate_limiter.limiter и concurrency) и одну память переводов.
+
+# Коды завершения процесса
+EXIT_OK = 0             # все задания выполнены, все строки переведены
+EXIT_INCOMPLETE = 1     # задания выполнены, но часть строк осталась без перевода (missing в логах)
+EXIT_CONFIG = 2         # неверные аргументы, файл заданий или настройка бэкенда
+EXIT_FAILED = 3         # хотя бы одно задание завершилось ошибкой
+EXIT_INTERRUPTED = 130  # прервано (Ctrl+C); переведённое сохранено в контрольных точках
+
+CATEGORIES = ('maps', 'other')
+
+# Настройки задания по умолчанию. Их переопределяют поле "defaults" файла заданий,
+# затем аргументы командной строки, затем поля самого задания.
+JOB_DEFAULTS = {
+    'categories': list(CATEGORIES),
+    'langs': [translator.TARGET_LANG],
+    'output': None,
+    'combine': False,
+    'streaming': False,
+    'resume': True,
+    'retry_missing': True,
+}
+
+
+def check_fields(fields: dict, where: str):
+    """Проверяет типы полей задания или defaults (ValueError, а не TypeError при разборе):
+    source — строка, categories и langs — строка или список строк, output — строка или null,
+    остальные — true/false.
+    """
+    for name, value in fields.items():
+        if name == 'source':
+            valid, expected = isinstance(value, str), 'строкой'
+        elif name in ('categories', 'langs'):
+            valid = isinstance(value, str) or (isinstance(value, list) and all(isinstance(v, str) for v in value))
+            expected = 'строкой или списком строк'
+        elif name == 'output':
+            valid, expected = value is None or isinstance(value, str), 'строкой'
+        else:
+            valid, expected = isinstance(value, bool), 'true или false'
+        if not valid:
+            raise ValueError(f'{where}: поле {name} должно быть {expected}, получено {value!r}')
+
+
+def parse_categories(value) -> list[str]:
+    """Категории из списка или строки через запятую; 'all' — все."""
+    items = value.split(',') if isinstance(value, str) else list(value)
+    categories = []
+    for item in items:
+        category = str(item).strip().lower()
+        if category == 'all':
+            return list(CATEGORIES)
+        if category not in CATEGORIES:
+            raise ValueError(f"Неизвестная категория: '{category}'. Допустимые: {', '.join(CATEGORIES)}, all")
+        if category not in categories:
+            categories.append(category)
+    if not categories:
+        raise ValueError('Не указана ни одна категория.')
+    return categories
+
+
+def make_job(raw, defaults: dict, base_dir: str) -> dict:
+    """Проверяет и дополняет задание: строка — путь к игре, словарь — {source, categories, langs, ...}.
+    Относительные пути считаются от base_dir (папки файла заданий).
+    output — шаблон папки вывода с {lang} или {LANG} и, при необходимости, {name} (имя папки игры);
+    по умолчанию <source>_<LANG> рядом с игрой.
+    Ошибки описания задания — ValueError.
+    """
+    if isinstance(raw, str):
+        raw = {'source': raw}
+    if not isinstance(raw, dict) or not raw.get('source'):
+        raise ValueError(f'В задании нет папки игры (source): {raw!r}')
+    unknown = set(raw) - set(JOB_DEFAULTS) - {'source'}
+    if unknown:
+        raise ValueError(f"Неизвестные поля задания {raw['source']}: {', '.join(sorted(unknown))}")
+    check_fields(raw, f"Задание {raw['source']}")
+
+    job = dict(defaults)
+    job.update(raw)
+    job['source'] = os.path.normpath(os.path.join(base_dir, job['source']))
+    job['categories'] = parse_categories(job['categories'])
+    langs = job['langs']
+    job['langs'] = parse_languages(langs if isinstance(langs, str) else ','.join(langs))
+    if job['output'] is None:
+        job['output'] = f"{job['source']}_{{LANG}}"
+    else:
+        job['output'] = os.path.normpath(os.path.join(base_dir, job['output']))
+        if len(job['langs']) > 1 and '{lang}' not in job['output'] and '{LANG}' not in job['output']:
+            raise ValueError(f"Задание {job['source']}: для нескольких языков output должен содержать {{lang}} или {{LANG}}")
+    if job['streaming'] and len(job['langs']) > 1:
+        raise ValueError(f"Задание {job['source']}: потоковый режим работает только с одним языком")
+    return job
+
+
+def load_jobs(path: str, defaults: dict) -> list[dict]:
+    """Читает файл заданий: JSON-список заданий или {"defaults": {...}, "jobs": [...]}."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {'jobs': data}
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list):
+        raise ValueError(f'{path}: ожидается список заданий или объект с полем "jobs"')
+    file_defaults = data.get('defaults') or {}
+    if not isinstance(file_defaults, dict):
+        raise ValueError(f'{path}: поле "defaults" должно быть объектом')
+    unknown = set(file_defaults) - set(JOB_DEFAULTS)
+    if unknown:
+        raise ValueError(f"{path}: неизвестные поля defaults: {', '.join(sorted(unknown))}")
+    check_fields(file_defaults, f'{path}: defaults')
+    merged = dict(JOB_DEFAULTS)
+    merged.update(file_defaults)
+    # Аргументы командной строки важнее defaults файла, но не полей самих заданий
+    merged.update(defaults)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    return [make_job(raw, merged, base_dir) for raw in data['jobs']]
+
+
+def run_job(job: dict, memory_path: str, workers=None, use_threads: bool = False) -> dict:
+    """Переводит одну игру на все языки задания, при retry_missing досылает пропуски.
+    Возвращает итог {source, langs, status, missing, logs, seconds}: status — ok или incomplete.
+    Исключения пробрасываются (задание считается failed).
+    """
+    started = time.perf_counter()
+    source = job['source']
+    if not os.path.isdir(source):
+        raise FileNotFoundError(f"Папка игры не найдена: '{source}'")
+    targets = {}
+    for lang in job['langs']:
+        targets[lang] = (job['output'].replace('{name}', os.path.basename(source))
+                         .replace('{lang}', lang).replace('{LANG}', lang.upper()))
+        os.makedirs(targets[lang], exist_ok=True)
+
+    if job['streaming']:
+        lang = job['langs'][0]
+        logs = {lang: translator.process_files_streaming(source, targets[lang], job['categories'], memory_path,
+                                                         resume=job['resume'], target_lang=lang)}
+    else:
+        logs = translator.process_files_multi(source, targets, job['categories'], memory_path, resume=job['resume'],
+                                              workers=workers, use_threads=use_threads, combine=job['combine'])
+
+    missing = {}
+    for lang, log_path in logs.items():
+        count = len(missing_indices(log_path)) if log_path else 0
+        if count and job['retry_missing']:
+            translator.retry_from_log(log_path, target_lang=lang, memory_path=memory_path)
+            count = len(missing_indices(log_path))
+        missing[lang] = count
+    return {
+        'source': source,
+        'langs': job['langs'],
+        'status': 'incomplete' if any(missing.values()) else 'ok',
+        'missing': missing,
+        'logs': logs,
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+
+
+def exit_code(results: list[dict], interrupted: bool = False) -> int:
+    if interrupted:
+        return EXIT_INTERRUPTED
+    statuses = {r['status'] for r in results}
+    if 'failed' in statuses:
+        return EXIT_FAILED
+    if 'incomplete' in statuses:
+        return EXIT_INCOMPLETE
+    return EXIT_OK
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Неинтерактивный перевод нескольких игр RPG Maker одним процессом",
+        epilog="Коды завершения: 0 — всё переведено, 1 — остались строки без перевода, "
+               "2 — ошибка аргументов, файла заданий или настройки бэкенда, 3 — задание завершилось ошибкой, "
+               "130 — прервано.")
+    parser.add_argument('sources', nargs='*', help="папки игр (каждая — отдельное задание с настройками из аргументов)")
+    parser.add_argument('--jobs', metavar='FILE',
+                        help='JSON-файл заданий: список или {"defaults": {...}, "jobs": [...]}')
+    parser.add_argument('--categories', help="maps, other или all, через запятую (по умолчанию all)")
+    parser.add_argument('--langs', help=f"целевые языки через запятую (по умолчанию {translator.TARGET_LANG})")
+    parser.add_argument('--output', help="шаблон папки вывода с {lang} или {LANG} и {name} — именем папки игры "
+                                         "(по умолчанию <source>_{LANG})")
+    parser.add_argument('--combine', action='store_true', default=None,
+                        help="просить переводы на несколько языков в одном запросе")
+    parser.add_argument('--streaming', action='store_true', default=None,
+                        help="потоковый режим (только для одного языка)")
+    parser.add_argument('--no-resume', dest='resume', action='store_false', default=None,
+                        help="не брать переводы из контрольных точек прерванных прогонов")
+    parser.add_argument('--no-retry', dest='retry_missing', action='store_false', default=None,
+                        help="не досылать строки без перевода после прогона")
+    parser.add_argument('--memory', metavar='PATH',
+                        help="общая память переводов всех заданий (по умолчанию translation_memory.sqlite3 "
+                             "рядом с файлом заданий или в текущей папке)")
+    parser.add_argument('--backend', choices=('gemini', 'http', 'fake'), default='gemini',
+                        help="бэкенд перевода: gemini, локальная HTTP-заглушка или заглушка в процессе")
+    parser.add_argument('--backend-url', default=None,
+                        help="адрес HTTP-заглушки (по умолчанию http://127.0.0.1:8765)")
+    parser.add_argument('--api-key-env', metavar='NAME',
+                        help="переменная окружения с ключом API (по умолчанию её выбирает SDK: "
+                             "GEMINI_API_KEY или GOOGLE_API_KEY)")
+    parser.add_argument('--check', action='store_true',
+                        help="перед заданиями проверить ключ и сеть (запрос списка моделей)")
+    parser.add_argument('--rpm', type=float, help="лимит запросов в минуту (по умолчанию из rate_limiter.py)")
+    parser.add_argument('--tpm', type=float, help="лимит токенов в минуту (по умолчанию из rate_limiter.py)")
+    parser.add_argument('--workers', type=int, default=translator.FILE_WORKERS,
+                        help="число работников для чтения и записи файлов (по умолчанию — по числу ядер)")
+    parser.add_argument('--threads', action='store_true',
+                        help="использовать пул потоков вместо пула процессов для работы с файлами")
+    parser.add_argument('--stop-on-error', action='store_true',
+                        help="остановиться на первом задании, завершившемся ошибкой")
+    parser.add_argument('--report', metavar='PATH', help="сохранить итоги заданий в JSON")
+    parser.add_argument('--metrics', metavar='PATH',
+                        help="сохранить метрики прогона: .prom/.txt — формат Prometheus, иначе JSON")
+    args = parser.parse_args(argv)
+
+    # Настройки из аргументов поверх JOB_DEFAULTS и defaults файла заданий
+    overrides = {key: getattr(args, key) for key in ('categories', 'langs', 'output', 'combine', 'streaming',
+                                                     'resume', 'retry_missing')
+                 if getattr(args, key) is not None}
+    try:
+        jobs = load_jobs(args.jobs, overrides) if args.jobs else []
+        cli_defaults = dict(JOB_DEFAULTS)
+        cli_defaults.update(overrides)
+        jobs += [make_job(source, cli_defaults, os.getcwd()) for source in args.sources]
+    except (OSError, ValueError) as e:
+        print(f'Ошибка в заданиях: {e}', file=sys.stderr)
+        return EXIT_CONFIG
+    if not jobs:
+        parser.print_usage(sys.stderr)
+        print('Не задано ни одного задания: укажите папки игр или --jobs.', file=sys.stderr)
+        return EXIT_CONFIG
+
+    memory_path = args.memory or os.path.join(
+        os.path.dirname(os.path.abspath(args.jobs)) if args.jobs else os.getcwd(), MEMORY_FILENAME)
+
+    # Один клиент на все задания
+    api_key = None
+    if args.api_key_env:
+        api_key = os.environ.get(args.api_key_env)
+        if not api_key:
+            print(f'Переменная окружения {args.api_key_env} не задана.', file=sys.stderr)
+            return EXIT_CONFIG
+    try:
+        translator.configure_backend(args.backend, args.backend_url, api_key=api_key, interactive=False,
+                                     check=args.check)
+    except Exception as e:
+        print(f'Не удалось настроить бэкенд {args.backend}: {e}', file=sys.stderr)
+        return EXIT_CONFIG
+    if args.rpm is not None or args.tpm is not None:
+        limiter.set_limits(args.rpm or DEFAULT_RPM, args.tpm or DEFAULT_TPM)
+
+    print(f'Заданий: {len(jobs)}. Память переводов: {memory_path}')
+    results = []
+    interrupted = False
+    for number, job in enumerate(jobs, 1):
+        print(f"\n=== Задание {number}/{len(jobs)}: {job['source']} ({', '.join(job['langs'])}) ===")
+        try:
+            result = run_job(job, memory_path, args.workers, args.threads)
+        except KeyboardInterrupt:
+            results.append({'source': job['source'], 'langs': job['langs'], 'status': 'interrupted'})
+            interrupted = True
+            break
+        except Exception as e:
+            print(f"Задание {job['source']} завершилось ошибкой: {e!r}")
+            results.append({'source': job['source'], 'langs': job['langs'], 'status': 'failed', 'error': repr(e)})
+            if args.stop_on_error:
+                break
+            continue
+        results.append(result)
+
+    print('\nИтоги заданий:')
+    for result in results:
+        line = f"  [{result['status']}] {result['source']}"
+        if result.get('seconds') is not None:
+            line += f" — {result['seconds']} с"
+        missing = {lang: n for lang, n in result.get('missing', {}).items() if n}
+        if missing:
+            line += ', без перевода: ' + ', '.join(f'{lang} {n}' for lang, n in missing.items())
+        if result.get('error'):
+            line += f" — {result['error']}"
+        print(line)
+    if len(results) < len(jobs):
+        print(f'  Не запущено заданий: {len(jobs) - len(results)}.')
+    print()
+    print(metrics.summary())
+
+    code = exit_code(results, interrupted)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'exit_code': code, 'jobs': results}, f, ensure_ascii=False, indent=2)
+    if args.metrics:
+        metrics.write(args.metrics)
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
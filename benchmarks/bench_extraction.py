@@ -0,0 +1,162 @@
+"""Микро-бенчмарк извлечения строк: прежний построчный разбор против rpgm_extract.extract_entries,
+а также прежний unmask (replace на каждый токен) против однопроходного.
+
+Запуск:  py benchmarks/bench_extraction.py [--lines 200000] [--repeat 3]
+Печатает строк в секунду для обоих вариантов и проверяет, что результаты совпадают.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rpgm_extract import extract_entries, mask_control_sequences, unmask_control_sequences  # noqa: E402
+
+
+def legacy_mask_control_sequences(s):
+    """Прежняя маскировка: регулярное выражение на каждой строке, даже без управляющих символов."""
+    tokens = []
+
+    def repl(m):
+        tokens.append(m.group(0))
+        return f"__CTRL{len(tokens)-1}__"
+
+    return re.sub(r'(\\[A-Za-z]+(?:\[[^\]]*\])?|\\.)', repl, s), tokens
+
+
+def legacy_unmask_control_sequences(s, tokens):
+    """Прежний unmask: полный проход по строке на каждый токен."""
+    for i, t in enumerate(tokens):
+        s = s.replace(f"__CTRL{i}__", t)
+    return s
+
+
+def comparable(entries):
+    """Плейсхолдеры в новых и старых записях разные — сравниваем восстановленный текст."""
+    return [(idx, kind, prefix, original, unmask_control_sequences(masked, tokens))
+            for idx, kind, prefix, original, masked, tokens in entries]
+
+
+def legacy_extract_entries(all_lines, category):
+    """Прежняя реализация из process_files: шаблоны компилируются на каждый файл,
+    каждая строка проверяется несколькими регулярными выражениями подряд."""
+    show_text_pattern = re.compile(r'^(\s*)ShowText\(\["((?:\\"|[^"])*)"\]\)')
+    is_map_file = category == 'maps'
+    maps_pattern = re.compile(r'^(.*?:\\#)(.*)') if is_map_file else None
+
+    entries = []
+    for idx, line in enumerate(all_lines):
+        match = show_text_pattern.search(line)
+        if match:
+            if re.search(r"[\u0400-\u04FF]", match.group(2)):
+                continue
+            masked, tokens = legacy_mask_control_sequences(match.group(2))
+            entries.append((idx, 'show', match.group(1), match.group(2), masked, tokens))
+            continue
+        if is_map_file and maps_pattern is not None:
+            m2 = maps_pattern.search(line)
+            if m2:
+                if re.search(r"[\u0400-\u04FF]", m2.group(2)):
+                    continue
+                masked, tokens = legacy_mask_control_sequences(m2.group(2))
+                entries.append((idx, 'maps', m2.group(1), m2.group(2), masked, tokens))
+                continue
+        if not is_map_file and category == 'other':
+            if re.search(r'[A-Za-z0-9]', line):
+                m_ws = re.match(r'^(\s*)(.*)$', line)
+                body = m_ws.group(2).rstrip('\n')
+                if re.search(r"[\u0400-\u04FF]", body):
+                    continue
+                masked, tokens = legacy_mask_control_sequences(body)
+                entries.append((idx, 'otherline', m_ws.group(1), body, masked, tokens))
+                continue
+    return entries
+
+
+WORDS = "the goblin courtesan sword shield potion heals you are dead yes no hero king castle gold".split()
+CONTROLS = ['\\\\c[2]', '\\\\c[0]', '\\\\i[64]', '\\\\.', '\\\\!', '\\\\|', '\\\\n[1]']
+
+
+def _phrase(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(1, 14))]
+    for _ in range(rng.randint(0, 3)):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(CONTROLS))
+    return ' '.join(words)
+
+
+def synthetic_lines(category, count, seed=1):
+    """Строки в стиле rvpacker-txt: в maps в основном команды событий, в other — описания."""
+    rng = random.Random(seed)
+    lines = []
+    for _ in range(count):
+        r = rng.random()
+        if category == 'maps':
+            if r < 0.25:
+                lines.append(f'    ShowText(["{_phrase(rng)}"])\n')
+            elif r < 0.35:
+                lines.append(f'Goblin Courtesan:\\#{_phrase(rng)}\n')
+            elif r < 0.38:
+                lines.append('    ShowText(["Привет"])\n')
+            else:
+                lines.append(f'    ControlSwitches([{rng.randint(1, 3000)}, {rng.randint(1, 3000)}, 0])\n')
+        else:
+            lines.append(_phrase(rng) + '\n' if r < 0.85 else '\n')
+    return lines
+
+
+def bench(func, lines, category, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(lines, category)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    report = {}
+    for category in ('maps', 'other'):
+        lines = synthetic_lines(category, args.lines)
+        legacy_time, legacy = bench(legacy_extract_entries, lines, category, args.repeat)
+        engine_time, engine = bench(extract_entries, lines, category, args.repeat)
+        assert comparable(engine) == comparable(legacy), f'результаты расходятся для {category}'
+        report[category] = {
+            'lines': len(lines),
+            'entries': len(engine),
+            'legacy_lines_per_sec': round(len(lines) / legacy_time),
+            'engine_lines_per_sec': round(len(lines) / engine_time),
+            'speedup': round(legacy_time / engine_time, 2),
+        }
+
+    # Строки, плотно набитые управляющими кодами (\c[n], \i[n], \.)
+    rng = random.Random(2)
+    heavy = [''.join(f'{rng.choice(CONTROLS[:4])}{rng.choice(WORDS)} ' for _ in range(rng.randint(10, 40)))
+             for _ in range(args.lines // 10)]
+    legacy_masked = [legacy_mask_control_sequences(t) for t in heavy]
+    new_masked = [mask_control_sequences(t) for t in heavy]
+    legacy_time, legacy = bench(lambda items, _: [legacy_unmask_control_sequences(m, t) for m, t in items],
+                                legacy_masked, None, args.repeat)
+    engine_time, engine = bench(lambda items, _: [unmask_control_sequences(m, t) for m, t in items],
+                                new_masked, None, args.repeat)
+    assert engine == legacy == heavy, 'unmask восстановил текст с ошибкой'
+    report['unmask'] = {
+        'strings': len(heavy),
+        'legacy_strings_per_sec': round(len(heavy) / legacy_time),
+        'engine_strings_per_sec': round(len(heavy) / engine_time),
+        'speedup': round(legacy_time / engine_time, 2),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""Бенчмарк разбора и сборки lang.json: прежний путь main.py (json.load, get_all_strings
+со списком пути на каждом уровне, глубокая копия через json.dumps/loads, json.dump)
+против json_strings.JsonStrings (ссылки на контейнеры и правка одного экземпляра).
+
+Запуск:  py benchmarks/bench_lang_json.py [--sizes-mb 1,10,40]
+Для каждого размера синтетического файла печатает время и пиковую память (tracemalloc)
+обоих вариантов и проверяет, что результаты совпадают как JSON.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from json_strings import JsonStrings  # noqa: E402
+
+WORDS = ("the goblin courtesan sword shield potion heals you are dead yes no hero king castle gold "
+         "village forest dragon quest reward master guard door key chest night morning").split()
+
+
+def synthetic_lang(path: str, size_mb: float, seed: int = 1):
+    """Вложенный словарь локализации: главы -> сцены -> реплики (строки, списки вариантов, числа)."""
+    rng = random.Random(seed)
+    target = int(size_mb * 1024 * 1024)
+    doc = {}
+    written = 0
+    chapter = 0
+    while written < target:
+        scenes = {}
+        for s in range(50):
+            lines = {}
+            for n in range(20):
+                text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 14))).capitalize() + '.'
+                if rng.random() < 0.1:
+                    lines[f'line_{n}'] = {'text': text, 'choices': [rng.choice(WORDS).capitalize() for _ in range(3)],
+                                          'voice': rng.randint(1, 9999)}
+                else:
+                    lines[f'line_{n}'] = text
+                written += len(text) + 16
+            scenes[f'scene_{s}'] = lines
+        doc[f'chapter_{chapter}'] = scenes
+        chapter += 1
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f, ensure_ascii=False, indent=2)
+
+
+def legacy(path: str, output_path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    strings = []
+
+    def recurse(obj, p):
+        if isinstance(obj, dict):
+            for key, value in obj.items(): recurse(value, p + [key])
+        elif isinstance(obj, list):
+            for i, item in enumerate(obj): recurse(item, p + [i])
+        elif isinstance(obj, str): strings.append((p, obj))
+    recurse(data, [])
+    translated_data = json.loads(json.dumps(data))
+    for p, text in strings:
+        temp = translated_data
+        for key in p[:-1]: temp = temp[key]
+        temp[p[-1]] = 'RU ' + text
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(translated_data, f, ensure_ascii=False, indent=2)
+
+
+def engine(path: str, output_path: str):
+    strings = JsonStrings(path)
+    strings.write(output_path, ['RU ' + text for text in strings.texts])
+
+
+def measure(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(elapsed, 3), round(peak / (1024 * 1024), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes-mb', default='1,10,40')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='rpgm_lang_')
+    report = []
+    for size in (float(s) for s in args.sizes_mb.split(',')):
+        source = os.path.join(workdir, 'lang.json')
+        synthetic_lang(source, size)
+        legacy_out = os.path.join(workdir, 'legacy.json')
+        engine_out = os.path.join(workdir, 'engine.json')
+        legacy_sec, legacy_mb = measure(legacy, source, legacy_out)
+        engine_sec, engine_mb = measure(engine, source, engine_out)
+        with open(legacy_out, encoding='utf-8') as a, open(engine_out, encoding='utf-8') as b:
+            assert json.load(a) == json.load(b), f'результаты расходятся для {size} МБ'
+        report.append({
+            'file_mb': round(os.path.getsize(source) / (1024 * 1024), 1),
+            'legacy_sec': legacy_sec,
+            'legacy_peak_mb': legacy_mb,
+            'engine_sec': engine_sec,
+            'engine_peak_mb': engine_mb,
+            'speedup': round(legacy_sec / engine_sec, 1),
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
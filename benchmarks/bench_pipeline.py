@@ -0,0 +1,220 @@
+"""Сквозной бенчмарк process_files на синтетических дампах rvpacker-txt (maps/other) с заглушкой API.
+
+Запуск:  py benchmarks/bench_pipeline.py [--sizes 1000,100000,1000000] [--latency 0.05] [--output result.json]
+Для каждого размера дерево генерируется один раз (кэшируется в --workdir), затем process_files
+прогоняется в отдельном процессе с FakeBackend (пиковая память меряется для одного прогона).
+Печатает JSON: время стадий (из metrics), пиковую RSS, число запросов к API,
+попадания в кэш и строк в секунду — для отслеживания регрессий.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LINES_PER_FILE = 2000
+
+WORDS = ("the goblin courtesan sword shield potion heals you are dead yes no hero king castle gold "
+         "village forest dragon quest reward master slave guard door key chest night morning").split()
+SPEAKERS = ['Goblin Courtesan:', 'Hero:', 'Guard:', 'Merchant:', '???:']
+# Управляющие коды в том виде, как они лежат в дампе (обратная косая черта экранирована)
+CONTROLS = ['\\\\.', '\\\\.', '\\\\|', '\\\\!', '\\\\c[2]', '\\\\c[0]', '\\\\n[1]', '\\\\i[64]', '\\\\v[12]']
+# Частые короткие реплики — дают реалистичную долю повторов для дедупликации
+COMMON = ['Yes', 'No', '...', 'Huh?', 'Thank you!', 'W-\\\\.WHO ARE YA!?\\\\.\\\\. I\'LL KILL YA!']
+SERVICE = [
+    '    ControlSwitches([{a}, {a}, 0])',
+    '    ControlVariables([{a}, {a}, 0, 0, {b}])',
+    '    Script(["$game_variables[{a}][17] = 2"])',
+    '    ShowPicture([1, "RND", 0, 0, 0, 0, 100, 100, 255, 0])',
+    '    CallCommonEvent([{b}])',
+    '    Wait([{b}])',
+    '    Empty([])',
+]
+
+
+def _phrase(rng):
+    if rng.random() < 0.15:
+        return rng.choice(COMMON)
+    words = [rng.choice(WORDS) for _ in range(rng.randint(2, 16))]
+    words[0] = words[0].capitalize()
+    for _ in range(rng.choices((0, 1, 2, 3), (50, 30, 15, 5))[0]):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(CONTROLS))
+    return ' '.join(words) + rng.choice(('.', '!', '?', '...'))
+
+
+def map_file_lines(rng, count):
+    """События карты: служебные команды и блоки ShowText (~25% строк с текстом)."""
+    lines = [f'CommonEvent {rng.randint(1, 999)}\n', f'Name = "{rng.choice(WORDS)}"\n', '\n', '  Page 0\n']
+    while len(lines) < count:
+        r = rng.random()
+        if r < 0.12:
+            lines.append('    ShowTextAttributes(["", 0, 2, 2])\n')
+            if rng.random() < 0.5:
+                lines.append(f'    ShowText(["{rng.choice(SPEAKERS)}"])\n')
+            for _ in range(rng.randint(1, 3)):
+                lines.append(f'    ShowText(["{_phrase(rng)}"])\n')
+        elif r < 0.16:
+            lines.append(f'{rng.choice(SPEAKERS)}\\#{_phrase(rng)}\n')
+        elif r < 0.17:
+            # Уже переведённая строка — пропускается извлечением
+            lines.append('    ShowText(["Привет, герой."])\n')
+        else:
+            lines.append(rng.choice(SERVICE).format(a=rng.randint(1, 3000), b=rng.randint(1, 999)) + '\n')
+    return lines[:count]
+
+
+def other_file_lines(rng, count):
+    """Базы данных (Actors, Items, ...): имена и описания, пустые строки между записями."""
+    lines = []
+    while len(lines) < count:
+        lines.append(f'{rng.choice(WORDS).capitalize()} {rng.randint(1, 99)}\n')
+        lines.append(_phrase(rng) + '\n')
+        lines.append('\n')
+    return lines[:count]
+
+
+def generate_tree(path, total_lines, seed=1):
+    """Дерево maps/ (80% строк) и other/ (20%) по LINES_PER_FILE строк в файле."""
+    for category, share, make in (('maps', 0.8, map_file_lines), ('other', 0.2, other_file_lines)):
+        folder = os.path.join(path, category)
+        os.makedirs(folder, exist_ok=True)
+        remaining = max(1, int(total_lines * share))
+        n = 0
+        while remaining > 0:
+            count = min(LINES_PER_FILE, remaining)
+            rng = random.Random(f'{seed}-{category}-{n}')
+            name = f'Map{n:04d}.txt' if category == 'maps' else f'Data{n:04d}.txt'
+            with open(os.path.join(folder, name), 'w', encoding='utf-8') as f:
+                f.writelines(make(rng, count))
+            remaining -= count
+            n += 1
+
+
+def peak_rss_mb():
+    """Пиковая RSS текущего процесса в МБ (None, если платформа её не даёт)."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux — килобайты, macOS — байты
+        return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / (1024 * 1024), 1)
+    except ImportError:
+        return None
+
+
+def run_one(args):
+    """Один прогон process_files в текущем процессе; печатает JSON с метриками."""
+    import rpgmaker_translator_lastV as translator
+    from metrics import metrics
+    from translation_backend import FakeBackend
+
+    translator.backend = FakeBackend(latency=args.latency, jitter=args.latency / 2,
+                                     rate_limit_rate=args.rate_limit, retry_after=0.1,
+                                     max_output_items=args.max_output_items, seed=1)
+    translator.limiter.set_limits(args.rpm, args.tpm)
+
+    source = args.source
+    output = args.source + '_OUT'
+    shutil.rmtree(output, ignore_errors=True)
+    lines = 0
+    for root, _, files in os.walk(source):
+        for name in files:
+            with open(os.path.join(root, name), 'rb') as f:
+                lines += sum(1 for _ in f)
+
+    metrics.reset()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        translator.process_files(source, output, workers=args.workers)
+    total = time.perf_counter() - start
+    shutil.rmtree(output, ignore_errors=True)
+
+    snap = metrics.snapshot()
+    stages = snap['stages_seconds']
+    counters = snap['counters']
+    latency = snap['histograms'].get('request_latency_seconds', {})
+    stats = translator.backend.stats
+    print(json.dumps({
+        'lines': lines,
+        'extraction_sec': round(stages.get('extract', 0.0), 3),
+        'cache_lookup_sec': round(stages.get('cache_lookup', 0.0), 3),
+        'translate_sec': round(stages.get('translate', 0.0), 3),
+        'reassembly_sec': round(stages.get('write', 0.0), 3),
+        'total_sec': round(total, 3),
+        'lines_per_sec': round(lines / total),
+        'peak_rss_mb': peak_rss_mb(),
+        'requests': counters.get('requests', 0),
+        'items_sent': stats['items'],
+        'rate_limited': counters.get('rate_limited', 0),
+        'retries': counters.get('retries', 0),
+        'truncated': counters.get('truncated_responses', 0),
+        'tokens_sent': counters.get('tokens_sent', 0),
+        'tokens_received': counters.get('tokens_received', 0),
+        'cache_hit_rate': snap['cache_hit_rate'],
+        'latency_p50': latency.get('p50'),
+        'latency_p95': latency.get('p95'),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,100000,1000000', help='размеры деревьев в строках, через запятую')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'rpgm_bench'),
+                        help='где хранить сгенерированные деревья')
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа заглушки, секунды')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='доля запросов, получающих 429')
+    parser.add_argument('--max-output-items', type=int, default=None, help='батч больше этого заглушка обрезает')
+    parser.add_argument('--rpm', type=float, default=1e6)
+    parser.add_argument('--tpm', type=float, default=1e9)
+    parser.add_argument('--workers', type=int, default=None, help='работники для файлов (по умолчанию по числу ядер)')
+    parser.add_argument('--output', default=None, help='записать JSON-отчёт ещё и в файл')
+    parser.add_argument('--source', help=argparse.SUPPRESS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_one(args)
+        return
+
+    report = {'python': sys.version.split()[0], 'platform': sys.platform, 'cpu_count': os.cpu_count(),
+              'latency': args.latency, 'rate_limit': args.rate_limit, 'runs': []}
+    for size in (int(s) for s in args.sizes.split(',')):
+        source = os.path.join(args.workdir, f'tree_{size}')
+        if not os.path.isdir(source):
+            print(f'Генерация дерева на {size} строк...', file=sys.stderr)
+            generate_tree(source + '.tmp', size)
+            os.replace(source + '.tmp', source)
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', '--source', source,
+               '--latency', str(args.latency), '--rate-limit', str(args.rate_limit),
+               '--rpm', str(args.rpm), '--tpm', str(args.tpm)]
+        if args.max_output_items is not None:
+            cmd += ['--max-output-items', str(args.max_output_items)]
+        if args.workers is not None:
+            cmd += ['--workers', str(args.workers)]
+        print(f'Прогон на {size} строк...', file=sys.stderr)
+        out = subprocess.run(cmd, check=True, capture_output=True, text=True, cwd=ROOT).stdout
+        report['runs'].append(dict(size=size, **json.loads(out.strip().splitlines()[-1])))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Бенчмарк сборки выходного файла: прежний цикл process_single_file (next() по записям
+на каждую строку и pop(0)) против rpgm_extract.reassemble_lines.
+
+Запуск:  py benchmarks/bench_reassembly.py [--sizes 12500,25000,50000,100000] [--legacy-max 25000]
+Для каждого размера синтетического файла maps печатает время и строк в секунду;
+прежний вариант квадратичный, поэтому на больших размерах он не запускается (--legacy-max).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_extraction import synthetic_lines  # noqa: E402
+from rpgm_extract import extract_entries, render_line, reassemble_lines  # noqa: E402
+
+
+def legacy_reassemble(all_lines, original_entries, translations):
+    """Прежняя сборка из process_single_file: O(строк × записей) плюс сдвиги списка в pop(0)."""
+    translations = list(translations)
+    out = []
+    for idx, line in enumerate(all_lines):
+        found = next((item for item in original_entries if item[0] == idx), None)
+        if found:
+            _, indentation, _ = found
+            translated_text = translations.pop(0)
+            translated_text_escaped = translated_text.replace('"', '\\"')
+            out.append(f'{indentation}ShowText(["{translated_text_escaped}"])\n')
+        else:
+            out.append(line)
+    return out
+
+
+def reassemble(all_lines, original_entries, translations):
+    replacements = {
+        line_idx: render_line('show', indentation, translated_text)
+        for (line_idx, indentation, _), translated_text in zip(original_entries, translations)
+    }
+    return reassemble_lines(all_lines, replacements)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='12500,25000,50000,100000')
+    parser.add_argument('--legacy-max', type=int, default=25_000)
+    args = parser.parse_args()
+
+    report = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        lines = synthetic_lines('maps', size)
+        # Как в process_single_file: только ShowText, в порядке строк
+        entries = [(idx, prefix, original) for idx, kind, prefix, original, _, _ in extract_entries(lines, 'maps')
+                   if kind == 'show']
+        translations = [f'RU {original}' for _, _, original in entries]
+
+        engine_time, engine = timed(reassemble, lines, entries, translations)
+        row = {
+            'lines': size,
+            'entries': len(entries),
+            'engine_sec': round(engine_time, 4),
+            'engine_lines_per_sec': round(size / engine_time),
+        }
+        if size <= args.legacy_max:
+            legacy_time, legacy = timed(legacy_reassemble, lines, entries, translations)
+            assert engine == legacy, f'результаты расходятся для {size} строк'
+            row['legacy_sec'] = round(legacy_time, 4)
+            row['legacy_lines_per_sec'] = round(size / legacy_time)
+            row['speedup'] = round(legacy_time / engine_time, 1)
+        report.append(row)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
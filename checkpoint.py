@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+
+# Имя файла контрольной точки по умолчанию (кладётся в папку вывода)
+CHECKPOINT_FILENAME = 'translate_checkpoint.jsonl'
+
+
+class Checkpoint:
+    """Журнал завершённых батчей в формате JSONL: одна строка на батч,
+    после каждой записи fsync, поэтому падение, Ctrl-C или исчерпание квоты
+    теряют не больше одного батча. При resume=True уже сохранённые переводы
+    загружаются в done и дальше не отправляются в API. Новые батчи только пишутся на диск
+    и в done не добавляются: переводы текущего прогона в памяти не копятся.
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.done: dict[str, str] = {}
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            self.done = self.load(path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # Без resume начинаем журнал заново
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    @staticmethod
+    def load(path: str) -> dict[str, str]:
+        """Читает журнал; недописанная последняя строка (обрыв при падении) пропускается."""
+        done: dict[str, str] = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    batch = json.loads(line)
+                except ValueError:
+                    continue
+                for masked, translated in batch.get('items', []):
+                    done[masked] = translated
+        return done
+
+    def record(self, pairs):
+        """Дописывает батч пар (маскированный текст, перевод) и сбрасывает его на диск.
+        Пустые переводы (строки без перевода) не сохраняются.
+        """
+        items = [[m, t] for m, t in pairs if t]
+        if not items:
+            return
+        line = json.dumps({'items': items}, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, remove: bool = False):
+        """Закрывает журнал; remove=True удаляет его после успешного завершения прогона."""
+        with self._lock:
+            self._file.close()
+            if remove:
+                try:
+                    os.remove(self.path)
+                except OSError:
+                    pass
@@ -0,0 +1,76 @@
+import json
+import os
+from array import array
+
+# Строковые значения JSON-файла (lang.json) для перевода.
+# Документ загружается один раз (C-парсер json), затем обходится без рекурсии в порядке
+# документа. Для каждой строки хранится не путь от корня, а ссылка на её контейнер
+# (dict или list) и ключ/индекс в нём — O(1) памяти на строку. Перевод вписывается прямо
+# в этот единственный экземпляр документа и выводится потоково json.dump — без глубокой копии
+# и без повторного прохода от корня для каждой строки.
+
+
+class JsonStrings:
+    """Строковые значения JSON-документа.
+    texts — уникальные непустые строки в порядке первого появления (одинаковые строки
+    переводятся один раз); для каждого вхождения хранятся контейнер, ключ и номер в texts.
+    Ключи объектов и строки из одних пробелов не переводятся.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            # Корень тоже может быть строкой — держим его в списке-обёртке
+            self._root = [json.load(f)]
+        self.texts: list[str] = []
+        self._containers: list = []
+        self._keys: list = []
+        self._text_ids = array('l')
+        self._scan()
+
+    def __len__(self) -> int:
+        """Число вхождений строк в документе (с повторами)."""
+        return len(self._text_ids)
+
+    def _scan(self):
+        ids: dict[str, int] = {}
+        texts = self.texts
+        containers = self._containers
+        keys = self._keys
+        text_ids = self._text_ids
+        # Стек итераторов вместо рекурсии: глубокая вложенность не упирается в лимит рекурсии
+        stack = [(self._root, iter(enumerate(self._root)))]
+        while stack:
+            container, items = stack[-1]
+            for key, value in items:
+                if isinstance(value, str):
+                    if not value.strip():
+                        continue
+                    text_id = ids.get(value)
+                    if text_id is None:
+                        text_id = ids[value] = len(texts)
+                        texts.append(value)
+                    containers.append(container)
+                    keys.append(key)
+                    text_ids.append(text_id)
+                elif isinstance(value, dict):
+                    stack.append((value, iter(value.items())))
+                    break
+                elif isinstance(value, list):
+                    stack.append((value, iter(enumerate(value))))
+                    break
+            else:
+                stack.pop()
+
+    def write(self, output_path: str, translations: list[str]):
+        """Вписывает переводы в документ (translations[i] — перевод texts[i];
+        пустой перевод оставляет оригинал) и пишет его атомарно: через временный файл и os.replace.
+        """
+        for container, key, text_id in zip(self._containers, self._keys, self._text_ids):
+            tr = translations[text_id] if text_id < len(translations) else None
+            if tr:
+                container[key] = tr
+        tmp_path = output_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._root[0], f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, output_path)
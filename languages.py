@@ -0,0 +1,57 @@
+# Целевые языки перевода: код -> название для промпта.
+# Код пишется в имя папки вывода (<source>_<CODE>) и в ключ памяти переводов,
+# название подставляется в инструкцию модели ("... to Russian").
+LANGUAGE_NAMES = {
+    'ru': 'Russian',
+    'uk': 'Ukrainian',
+    'be': 'Belarusian',
+    'en': 'English',
+    'de': 'German',
+    'fr': 'French',
+    'es': 'Spanish',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'pt-br': 'Brazilian Portuguese',
+    'pl': 'Polish',
+    'cs': 'Czech',
+    'tr': 'Turkish',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'zh': 'Simplified Chinese',
+    'zh-tw': 'Traditional Chinese',
+    'vi': 'Vietnamese',
+    'id': 'Indonesian',
+    'th': 'Thai',
+}
+
+
+def language_name(code: str) -> str:
+    """Название языка для промпта; неизвестный код возвращается как есть."""
+    return LANGUAGE_NAMES.get(code.lower(), code)
+
+
+def language_code(name: str) -> str | None:
+    """Код языка по названию из LANGUAGE_NAMES (без учёта регистра) или None."""
+    name = name.strip().lower()
+    for code, known in LANGUAGE_NAMES.items():
+        if known.lower() == name:
+            return code
+    return None
+
+
+def parse_languages(spec: str) -> list[str]:
+    """Список кодов из строки вида "ru,es, de" (повторы убираются, порядок сохраняется).
+    Неизвестный код — ValueError: модель не должна получать инструкцию с непонятным языком.
+    """
+    codes = []
+    for part in spec.split(','):
+        code = part.strip().lower()
+        if not code:
+            continue
+        if code not in LANGUAGE_NAMES:
+            raise ValueError(f"Неизвестный код языка: '{code}'. Допустимые: {', '.join(LANGUAGE_NAMES)}")
+        if code not in codes:
+            codes.append(code)
+    if not codes:
+        raise ValueError('Не указан ни один целевой язык.')
+    return codes
@@ -1,10 +1,55 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
-import google.generativeai as genai
-import json
+from tkinter import filedialog, messagebox, scrolledtext, ttk
 import os
+import queue
 import time
 import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from rate_limiter import concurrency
+from translation_backend import GeminiBackend
+from batch_packer import BatchPacker
+from batch_requests import BatchRequester, TranslationCancelled
+from json_strings import JsonStrings
+
+# Модель Gemini для перевода (запросы идут через translation_backend.GeminiBackend).
+# Пакетный режим просит ответ по JSON-схеме — нужна модель с поддержкой response_schema.
+MODEL_NAME = 'gemini-2.5-flash'
+
+# Пакетный режим: размер пакета подбирается по длине строк (BatchPacker) в пределах
+# бюджета выходных токенов; «Макс. строк в пакете» — лишь верхний предел
+CHUNK_OUTPUT_BUDGET = 8000
+# Повторы после 429 и ошибок, досылка недостающих строк и проверка ответов — в batch_requests.py
+# (общие с rpgmaker_translator_lastV.py)
+
+# Рабочий поток не трогает виджеты: события (лог, прогресс, завершение) идут через очередь,
+# которую главный цикл Tk разбирает пачками раз в UI_POLL_MS миллисекунд
+UI_POLL_MS = 100
+MAX_EVENTS_PER_POLL = 1000
+# Окно лога хранит только последние LOG_MAX_LINES строк
+LOG_MAX_LINES = 2000
+
+
+def batch_instruction(target_language):
+    """Инструкция пакетного запроса; за ней идут строки 'index: text'."""
+    return (
+        f"Translate each of the following entries to the language with code '{target_language}'. "
+        "Each entry is given as 'index: text'. Return one item per entry with its original numeric index "
+        "and its translation. Keep placeholders in curly braces such as {0}, {1} exactly as written, "
+        "and keep tags and markup unchanged. "
+        "Do not add commentary or surrounding quotation marks.\n\n"
+    )
+
+
+def single_prompt(text, target_language):
+    """Запрос на одну строку (построчный режим и последние упрямые строки пакета)."""
+    return (
+        f"Translate the following text to the language with code '{target_language}'. "
+        "Keep placeholders in curly braces such as {0}, {1} exactly as written, do not add or remove any. "
+        "Respond with only the translated text, without any additional explanations, original text "
+        "or surrounding quotation marks.\n\n"
+        f"Text: {text}"
+    )
+
 
 class TranslatorApp:
     def __init__(self, root):
@@ -16,12 +61,20 @@ class TranslatorApp:
         self.file_path = tk.StringVar()
         self.target_language_code = tk.StringVar(value="ru") # Изменено на код языка
         self.translation_mode = tk.StringVar(value="chunk")
-        self.chunk_size = tk.IntVar(value=10)
+        self.chunk_size = tk.IntVar(value=200)
+        self.max_parallel = tk.IntVar(value=4)
         self.api_key = tk.StringVar()
         self.auto_translate = tk.BooleanVar(value=False) # Переменная для галочки
+        self.progress_text = tk.StringVar(value="")
+
+        # Очередь событий от рабочего потока и флаг отмены
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.progress_started = None
 
         # --- Создание виджетов ---
         self.create_widgets()
+        self.root.after(UI_POLL_MS, self.drain_events)
 
     def create_widgets(self):
         # Фрейм для API ключа
@@ -53,17 +106,32 @@ class TranslatorApp:
         tk.Radiobutton(options_frame, text="Пакетами (чанками)", variable=self.translation_mode, value="chunk", command=self.toggle_chunk_entry).grid(row=1, column=1, sticky="w", padx=5)
         tk.Radiobutton(options_frame, text="Построчно", variable=self.translation_mode, value="line", command=self.toggle_chunk_entry).grid(row=1, column=2, sticky="w", padx=5)
         
-        tk.Label(options_frame, text="Размер пакета:").grid(row=2, column=0, sticky="w", padx=5, pady=2)
+        tk.Label(options_frame, text="Макс. строк в пакете:").grid(row=2, column=0, sticky="w", padx=5, pady=2)
         self.chunk_entry = tk.Entry(options_frame, textvariable=self.chunk_size, width=5)
         self.chunk_entry.grid(row=2, column=1, sticky="w", padx=5)
 
+        tk.Label(options_frame, text="Параллельных запросов:").grid(row=3, column=0, sticky="w", padx=5, pady=2)
+        self.parallel_entry = tk.Entry(options_frame, textvariable=self.max_parallel, width=5)
+        self.parallel_entry.grid(row=3, column=1, sticky="w", padx=5)
+
         # НОВИНКА: Галочка для авто-перевода
         auto_translate_check = tk.Checkbutton(self.root, text="Начинать перевод без подтверждения", variable=self.auto_translate)
         auto_translate_check.pack(pady=(10, 5))
 
-        # Кнопка запуска
-        self.translate_button = tk.Button(self.root, text="Начать перевод", command=self.start_translation_thread, font=("Helvetica", 12, "bold"))
-        self.translate_button.pack(pady=5)
+        # Кнопки запуска и отмены
+        buttons_frame = tk.Frame(self.root)
+        buttons_frame.pack(pady=5)
+        self.translate_button = tk.Button(buttons_frame, text="Начать перевод", command=self.start_translation_thread, font=("Helvetica", 12, "bold"))
+        self.translate_button.pack(side="left", padx=5)
+        self.cancel_button = tk.Button(buttons_frame, text="Отмена", command=self.cancel_translation, state="disabled")
+        self.cancel_button.pack(side="left", padx=5)
+
+        # Прогресс: полоса и строка со скоростью и оставшимся временем
+        progress_frame = tk.Frame(self.root)
+        progress_frame.pack(fill="x", padx=10)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+        self.progress_bar.pack(fill="x")
+        tk.Label(progress_frame, textvariable=self.progress_text, anchor="w").pack(fill="x")
 
         # Окно логов
         log_frame = tk.LabelFrame(self.root, text="Лог выполнения", padx=10, pady=10)
@@ -72,10 +140,9 @@ class TranslatorApp:
         self.log_area.pack(fill="both", expand=True)
 
     def toggle_chunk_entry(self):
-        if self.translation_mode.get() == "chunk":
-            self.chunk_entry.config(state="normal")
-        else:
-            self.chunk_entry.config(state="disabled")
+        state = "normal" if self.translation_mode.get() == "chunk" else "disabled"
+        self.chunk_entry.config(state=state)
+        self.parallel_entry.config(state=state)
 
     def browse_file(self):
         filename = filedialog.askopenfilename(
@@ -85,21 +152,88 @@ class TranslatorApp:
         if filename:
             self.file_path.set(filename)
 
+    # --- События рабочего потока (вызываются из любого потока) ---
     def log(self, message):
+        self.events.put(('log', message))
+
+    def report_progress(self, done, total):
+        self.events.put(('progress', done, total))
+
+    # --- Разбор событий в главном потоке ---
+    def drain_events(self):
+        """Забирает накопившиеся события пачкой: одна вставка в лог и одна прокрутка на пачку."""
+        lines = []
+        try:
+            for _ in range(MAX_EVENTS_PER_POLL):
+                event = self.events.get_nowait()
+                if event[0] == 'log':
+                    lines.append(event[1])
+                elif event[0] == 'progress':
+                    self.show_progress(event[1], event[2])
+                elif event[0] == 'finished':
+                    self.finish_translation(*event[1:])
+        except queue.Empty:
+            pass
+        if lines:
+            self.append_log(lines)
+        self.root.after(UI_POLL_MS, self.drain_events)
+
+    def append_log(self, lines):
         self.log_area.config(state="normal")
-        self.log_area.insert(tk.END, message + "\n")
+        self.log_area.insert(tk.END, "\n".join(lines[-LOG_MAX_LINES:]) + "\n")
+        # Кольцевой буфер: старые строки удаляются, окно не растёт бесконечно
+        line_count = int(self.log_area.index("end-1c").split(".")[0]) - 1
+        if line_count > LOG_MAX_LINES:
+            self.log_area.delete("1.0", f"{line_count - LOG_MAX_LINES + 1}.0")
         self.log_area.config(state="disabled")
         self.log_area.see(tk.END)
 
+    def show_progress(self, done, total):
+        self.progress_bar.config(maximum=max(1, total), value=done)
+        elapsed = time.monotonic() - self.progress_started if self.progress_started else 0
+        rate = done / elapsed if elapsed > 0 else 0
+        text = f"{done}/{total} строк"
+        if rate > 0:
+            remaining = (total - done) / rate
+            text += f", {rate:.1f} строк/с, осталось ~{int(remaining // 60)}:{int(remaining % 60):02d}"
+        self.progress_text.set(text)
+
+    def finish_translation(self, status, message):
+        self.translate_button.config(state="normal", text="Начать перевод")
+        self.cancel_button.config(state="disabled", text="Отмена")
+        if status == 'ok':
+            messagebox.showinfo("Готово!", message)
+        elif status == 'error':
+            messagebox.showerror("Произошла ошибка", message)
+
+    def cancel_translation(self):
+        # Рабочий поток проверяет флаг между запросами; ожидание квоты прерывается сразу
+        self.cancel_event.set()
+        self.cancel_button.config(state="disabled", text="Отменяется...")
+        self.log("Отмена: дожидаюсь завершения текущего запроса...")
+
     def start_translation_thread(self):
+        # Настройки читаются здесь, в главном потоке: рабочий поток получает готовые значения
+        # и не обращается к переменным Tk
+        api_key = self.api_key.get()
+        file_path = self.file_path.get()
+        target_lang = self.target_language_code.get().strip()
+        mode = self.translation_mode.get()
+        try:
+            chunk_size = max(1, self.chunk_size.get())
+            max_parallel = max(1, self.max_parallel.get())
+        except tk.TclError:
+            messagebox.showerror("Ошибка", "Размер пакета и число параллельных запросов должны быть целыми числами.")
+            return
+
         # Проверки перед запуском
-        if not self.api_key.get():
+        if not api_key:
             messagebox.showerror("Ошибка", "Пожалуйста, введите ваш Gemini API ключ.")
             return
-        if not self.file_path.get():
+        if not file_path:
             messagebox.showerror("Ошибка", "Пожалуйста, выберите файл для перевода.")
             return
-        if not self.target_language_code.get().strip():
+        if not target_lang:
             messagebox.showerror("Ошибка", "Пожалуйста, введите код языка для перевода.")
             return
             
@@ -107,132 +241,127 @@ class TranslatorApp:
         if not self.auto_translate.get():
             confirmed = messagebox.askyesno(
                 "Подтверждение",
-                f"Вы уверены, что хотите перевести файл на язык с кодом '{self.target_language_code.get()}'?"
+                f"Вы уверены, что хотите перевести файл на язык с кодом '{target_lang}'?"
             )
             if not confirmed:
                 return  # Пользователь нажал "Нет", выходим
 
         self.translate_button.config(state="disabled", text="В процессе...")
+        self.cancel_button.config(state="normal", text="Отмена")
+        self.cancel_event.clear()
+        self.progress_started = None
+        self.progress_bar.config(value=0)
+        self.progress_text.set("")
         self.log_area.config(state="normal")
         self.log_area.delete(1.0, tk.END)
         self.log_area.config(state="disabled")
-        
-        thread = threading.Thread(target=self.run_translation)
+
+        thread = threading.Thread(target=self.run_translation,
+                                  args=(api_key, file_path, target_lang, mode, chunk_size, max_parallel))
         thread.daemon = True
         thread.start()
 
-    def run_translation(self):
+    def run_translation(self, api_key, file_path, target_lang, mode, chunk_size, max_parallel):
+        """Рабочий поток: все настройки приходят аргументами из start_translation_thread."""
         try:
             self.log("Конфигурация Gemini API...")
-            genai.configure(api_key=self.api_key.get())
-            model = genai.GenerativeModel('gemini-pro')
-
-            self.log(f"Чтение файла: {self.file_path.get()}")
-            with open(self.file_path.get(), 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            requester = BatchRequester(GeminiBackend(api_key), MODEL_NAME, batch_instruction,
+                                       single_prompt, log=self.log, cancel=self.cancel_event)
 
-            strings_with_paths = self.get_all_strings(data)
-            paths = [p for p, _ in strings_with_paths]
-            strings_to_translate = [s for _, s in strings_with_paths]
-            self.log(f"Найдено {len(strings_to_translate)} строк для перевода.")
+            self.log(f"Чтение файла: {file_path}")
+            # Для строк запоминаются только контейнер и ключ, а не путь от корня (см. json_strings.py)
+            strings = JsonStrings(file_path)
+            strings_to_translate = strings.texts
+            self.log(f"Найдено {len(strings)} строк для перевода, уникальных: {len(strings_to_translate)}.")
+            total = len(strings_to_translate)
+            self.progress_started = time.monotonic()
+            self.report_progress(0, total)
 
-            # Используем код языка для запроса к API
-            target_lang = self.target_language_code.get()
-            mode = self.translation_mode.get()
             translated_strings = []
 
             if mode == 'line':
                 self.log("Начало построчного перевода...")
                 for i, string in enumerate(strings_to_translate):
-                    translated = self.translate_text(model, string, target_lang)
+                    translated = requester.translate_single(i, string, target_lang)
                     translated_strings.append(translated)
-                    self.log(f"({i+1}/{len(strings_to_translate)}) '{string}' -> '{translated}'")
-                    time.sleep(1)
+                    self.log(f"({i+1}/{total}) '{string}' -> '{translated}'")
+                    self.report_progress(i + 1, total)
 
             elif mode == 'chunk':
-                chunk_s = self.chunk_size.get()
-                self.log(f"Начало перевода пакетами по {chunk_s} строк...")
-                for i in range(0, len(strings_to_translate), chunk_s):
-                    chunk = strings_to_translate[i:i+chunk_s]
-                    translated_chunk = self.translate_chunk(model, chunk, target_lang)
-                    translated_strings.extend(translated_chunk)
-                    self.log(f"Переведен пакет {i//chunk_s + 1}...")
-                    time.sleep(2)
+                translated_strings = self.translate_chunks(requester, strings_to_translate, target_lang,
+                                                           chunk_size, max_parallel)
 
             self.log("Сборка переведенного JSON файла...")
-            final_translations = list(zip(paths, translated_strings))
-            translated_data = self.build_translated_json(data, final_translations)
-            
             # Обновлено: Формирование имени файла
-            original_dir = os.path.dirname(self.file_path.get())
-            lang_code = self.target_language_code.get().lower()
+            original_dir = os.path.dirname(file_path)
+            lang_code = target_lang.lower()
             output_filename = os.path.join(original_dir, f'lang_{lang_code}.json')
 
-            with open(output_filename, 'w', encoding='utf-8') as f:
-                json.dump(translated_data, f, ensure_ascii=False, indent=2)
+            # Переводы вписываются в загруженный документ, он выводится потоково
+            strings.write(output_filename, translated_strings)
             
             self.log("="*30)
             self.log("ПЕРЕВОД УСПЕШНО ЗАВЕРШЕН!")
             self.log(f"Файл сохранен как: {output_filename}")
-            messagebox.showinfo("Готово!", f"Перевод завершен!\nФайл сохранен как:\n{output_filename}")
+            message = f"Перевод завершен!\nФайл сохранен как:\n{output_filename}"
+            untranslated = sum(1 for tr in translated_strings if not tr)
+            if untranslated:
+                self.log(f"Без перевода осталось строк: {untranslated} (в файле оставлен оригинал).")
+                message += f"\nБез перевода осталось строк: {untranslated}."
+            self.events.put(('finished', 'ok', message))
 
+        except TranslationCancelled:
+            # Файл не записывается: частичный перевод не подменяет исходный
+            self.log("Перевод отменён, файл не сохранён.")
+            self.events.put(('finished', 'cancelled', ''))
         except Exception as e:
             self.log(f"ОШИБКА: {e}")
-            messagebox.showerror("Произошла ошибка", f"Детали ошибки:\n{e}")
-        finally:
-            self.translate_button.config(state="normal", text="Начать перевод")
-            
-    # --- Вспомогательные функции (остаются без изменений) ---
-    # ... (здесь находятся функции get_all_strings, build_translated_json, 
-    # translate_text, translate_chunk из предыдущего ответа) ...
-    def get_all_strings(self, data):
-        strings = []
-        def recurse(obj, path):
-            if isinstance(obj, dict):
-                for key, value in obj.items(): recurse(value, path + [key])
-            elif isinstance(obj, list):
-                for i, item in enumerate(obj): recurse(item, path + [i])
-            elif isinstance(obj, str): strings.append((path, obj))
-        recurse(data, [])
-        return strings
-
-    def build_translated_json(self, original_data, translations):
-        translated_data = json.loads(json.dumps(original_data))
-        for path, translated_string in translations:
-            temp = translated_data
-            for key in path[:-1]: temp = temp[key]
-            temp[path[-1]] = translated_string
-        return translated_data
-
-    def translate_text(self, model, text, target_language):
-        try:
-            prompt = f"Translate the following text to the language with code '{target_language}'. Respond with only the translated text, without any additional explanations or original text.: '{text}'"
-            response = model.generate_content(prompt)
-            return response.text.strip().strip("'\"")
-        except Exception as e:
-            self.log(f"Ошибка при переводе текста: {e}")
-            return text
+            self.events.put(('finished', 'error', f"Детали ошибки:\n{e}"))
 
-    def translate_chunk(self, model, chunk, target_language):
-        try:
-            numbered_lines = "\n".join([f"{i+1}. {line}" for i, line in enumerate(chunk)])
-            prompt = f"""Translate the following numbered list of texts to the language with code '{target_language}'.
-            Maintain the original numbering in your response. Respond ONLY with the translated numbered list.
-            
-            {numbered_lines}
-            """
-            response = model.generate_content(prompt)
-            translated_lines = response.text.strip().split('\n')
-            cleaned_translations = [line.split('. ', 1)[1] if '. ' in line else line for line in translated_lines]
-
-            if len(cleaned_translations) == len(chunk):
-                return cleaned_translations
-            else:
-                self.log("Предупреждение: Количество строк не совпадает. Возвращаю оригинал.")
-                return chunk
-        except Exception as e:
-            self.log(f"Ошибка при переводе чанка: {e}")
-            return chunk
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise TranslationCancelled()
+
+    # --- Вспомогательные функции ---
+    def translate_chunks(self, requester, texts, target_language, chunk_size, parallel):
+        """Пакетный режим: пакеты по бюджету токенов, до «Параллельных запросов» одновременно
+        (фактическое окно подстраивает concurrency по 429). Каждый пакет переводит
+        requester.translate_chunk (проверка ответа, досылка недостающих строк, см. batch_requests.py).
+        Возвращает переводы в порядке texts; для непереведённых строк — пустая строка (в файле останется оригинал)."""
+        total = len(texts)
+        items = list(enumerate(texts))
+        # Сообщения упаковщика (уменьшение бюджета) идут в окно лога, а не в stdout
+        packer = BatchPacker(output_budget=CHUNK_OUTPUT_BUDGET, max_items=chunk_size, log=self.log)
+        results = {}
+        self.log(f"Начало перевода пакетами (до {parallel} запросов одновременно)...")
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            in_flight = {}
+            i = 0
+            chunk_no = 0
+            while i < total or in_flight:
+                # После отмены новые пакеты не отправляются, начатые дожидаются ответа
+                while i < total and not self.cancel_event.is_set() and len(in_flight) < concurrency.current(parallel):
+                    end = packer.take(items, i)
+                    chunk = items[i:end]
+                    chunk_no += 1
+                    in_flight[pool.submit(requester.translate_chunk, chunk, i, target_language)] = \
+                        (chunk_no, chunk, packer.estimate_output(chunk))
+                    i = end
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    number, chunk, estimated_output = in_flight.pop(fut)
+                    try:
+                        chunk_results, saw_429, success, truncated, output_tokens = fut.result()
+                    except TranslationCancelled:
+                        continue
+                    results.update(chunk_results)
+                    packer.feedback(truncated, saw_429, success, estimated_output, output_tokens)
+                    self.log(f"Переведен пакет {number} ({len(chunk_results)} из {len(chunk)} строк).")
+                    self.report_progress(len(results), total)
+        self.check_cancelled()
+        return [results.get(idx, '') for idx in range(total)]
 
 if __name__ == "__main__":
     root = tk.Tk()
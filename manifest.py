@@ -0,0 +1,82 @@
+import json
+import os
+
+# Манифест прогона (кладётся в папку вывода). Для каждого исходного файла
+# (ключ — путь относительно исходной папки) хранит:
+#   sha      — хэш содержимого файла
+#   size, mtime_ns — для быстрой проверки без чтения файла
+#   complete — все строки файла переведены (иначе файл обрабатывается заново)
+# При повторном прогоне (патч игры) неизменённые файлы пропускаются целиком.
+# Переводов манифест не хранит: неизменённые строки изменённых файлов находятся в памяти переводов,
+# поэтому на каждый файл в памяти держится одна короткая запись.
+# Как и память переводов, манифест привязан к языку, модели и версии промпта (поля верхнего уровня):
+# если они другие, манифест прошлого прогона не используется и всё переводится заново.
+MANIFEST_FILENAME = 'translate_manifest.json'
+
+
+class Manifest:
+    """Манифест хэшей исходных файлов для инкрементального перевода.
+    lang, model, prompt_version — ключ переводов этого прогона (как в TranslationMemory).
+    """
+
+    def __init__(self, path: str, lang: str | None = None, model: str | None = None,
+                 prompt_version: int | None = None):
+        self.path = path
+        self.key = {'lang': lang, 'model': model, 'prompt_version': prompt_version}
+        self.old: dict[str, dict] = {}
+        self.new: dict[str, dict] = {}
+        self.skipped = 0
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                # Переводы другой модели или инструкции (или манифест без ключа) не переиспользуем
+                if all(data.get(name) == value for name, value in self.key.items()):
+                    self.old = data.get('files', {})
+            except (OSError, ValueError, AttributeError):
+                # Повреждённый манифест — просто обрабатываем всё заново
+                self.old = {}
+
+    def stat_unchanged(self, relative_path: str, source_path: str, output_path: str) -> bool:
+        """Файл не менялся по размеру и времени изменения, полностью переведён и его выходной файл на месте.
+        Такой файл даже не читается; запись о нём переносится в новый манифест.
+        """
+        entry = self.old.get(relative_path)
+        if not entry or not entry.get('complete') or not os.path.exists(output_path):
+            return False
+        try:
+            st = os.stat(source_path)
+        except OSError:
+            return False
+        if st.st_size != entry.get('size') or st.st_mtime_ns != entry.get('mtime_ns'):
+            return False
+        self.new[relative_path] = entry
+        self.skipped += 1
+        return True
+
+    def content_unchanged(self, relative_path: str, source_path: str, sha: str, output_path: str) -> bool:
+        """Файл прочитан (время изменения другое), но содержимое то же — тоже пропускаем."""
+        entry = self.old.get(relative_path)
+        if not entry or not entry.get('complete') or entry.get('sha') != sha or not os.path.exists(output_path):
+            return False
+        self.new[relative_path] = dict(entry, **self._stat(source_path))
+        self.skipped += 1
+        return True
+
+    def record(self, relative_path: str, source_path: str, sha: str, entries, translations: dict[str, str]):
+        """Запоминает обработанный файл: хэш содержимого и переведены ли все его строки."""
+        # Строка без перевода — как статус missing в логе: файл нужно будет обработать снова
+        complete = all(translations.get(entry[4]) for entry in entries)
+        self.new[relative_path] = {'sha': sha, **self._stat(source_path), 'complete': complete}
+
+    def save(self):
+        """Записывает манифест атомарно. Удалённые из игры файлы в него не попадают."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({**self.key, 'files': self.new}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _stat(source_path: str) -> dict:
+        st = os.stat(source_path)
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
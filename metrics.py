@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Метрики прогона: длительности стадий, счётчики и гистограммы задержек запросов.
+# Один общий экземпляр metrics делят все потоки процесса (как limiter в rate_limiter.py).
+# Выгрузка — JSON (write('metrics.json')) или текстовый формат Prometheus (write('metrics.prom')),
+# краткая сводка для консоли — summary().
+
+# Границы корзин гистограммы задержек, секунды
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PROMETHEUS_PREFIX = 'rpgm_'
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (число наблюдений не ниже каждой границы)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """Оценка квантиля сверху: граница корзины, в которую он попал."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': {str(b): n for b, n in zip(self.buckets + ('+Inf',), self.counts)},
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+        }
+
+
+class Metrics:
+    """Потокобезопасный набор метрик: stage() — длительность стадии, inc() — счётчик,
+    observe() — наблюдение в гистограмму."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.stages: dict[str, float] = {}
+            self.counters: dict[str, float] = {}
+            self.histograms: dict[str, Histogram] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Суммирует время выполнения блока в стадии name (стадии из разных потоков складываются)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(value)
+
+    def cache_hit_rate(self) -> float | None:
+        """Доля строк, взятых из памяти переводов или контрольной точки, среди всех уникальных."""
+        hits = self.counters.get('cache_hits', 0)
+        total = hits + self.counters.get('cache_misses', 0)
+        return round(hits / total, 4) if total else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'started': self.started,
+                'elapsed_seconds': round(time.time() - self.started, 3),
+                'stages_seconds': {k: round(v, 6) for k, v in self.stages.items()},
+                'counters': dict(self.counters),
+                'cache_hit_rate': self.cache_hit_rate(),
+                'histograms': {k: h.to_dict() for k, h in self.histograms.items()},
+            }
+
+    def to_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus."""
+        out = []
+        with self._lock:
+            name = PROMETHEUS_PREFIX + 'stage_seconds'
+            out.append(f'# TYPE {name} gauge')
+            for stage, seconds in sorted(self.stages.items()):
+                out.append(f'{name}{{stage="{stage}"}} {seconds:.6f}')
+            for counter, value in sorted(self.counters.items()):
+                name = PROMETHEUS_PREFIX + counter + '_total'
+                out.append(f'# TYPE {name} counter')
+                out.append(f'{name} {value:g}')
+            for hist_name, hist in sorted(self.histograms.items()):
+                name = PROMETHEUS_PREFIX + hist_name
+                out.append(f'# TYPE {name} histogram')
+                cumulative = 0
+                for bound, n in zip(hist.buckets + ('+Inf',), hist.counts):
+                    cumulative += n
+                    out.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+                out.append(f'{name}_sum {hist.sum:.6f}')
+                out.append(f'{name}_count {hist.count}')
+        return '\n'.join(out) + '\n'
+
+    def write(self, path: str):
+        """Сохраняет метрики: .prom/.txt — формат Prometheus, иначе JSON."""
+        if path.endswith(('.prom', '.txt')):
+            text = self.to_prometheus()
+        else:
+            text = json.dumps(self.snapshot(), ensure_ascii=False, indent=2) + '\n'
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+    def summary(self) -> str:
+        """Краткая сводка прогона для консоли."""
+        snap = self.snapshot()
+        c = snap['counters']
+        lines = ['Сводка прогона:']
+        if snap['stages_seconds']:
+            lines.append('  стадии: ' + ', '.join(f'{k} {v:.2f} с' for k, v in snap['stages_seconds'].items()))
+        lines.append(f"  запросов к API: {c.get('requests', 0):g} (батчей {c.get('batch_requests', 0):g}, "
+                     f"досылок {c.get('salvage_requests', 0):g}, по одной строке {c.get('single_requests', 0):g}), "
+                     f"ошибок {c.get('request_errors', 0):g}, 429: {c.get('rate_limited', 0):g}, "
+                     f"повторов {c.get('retries', 0):g}, обрезанных ответов {c.get('truncated_responses', 0):g}")
+        lines.append(f"  токены: отправлено ~{c.get('tokens_sent', 0):g}, получено {c.get('tokens_received', 0):g}; "
+                     f"ожидание лимитера {c.get('limiter_wait_seconds', 0):.2f} с")
+        latency = snap['histograms'].get('request_latency_seconds')
+        if latency and latency['count']:
+            lines.append(f"  задержка запроса: среднее {latency['sum'] / latency['count']:.2f} с, "
+                         f"p50 ≤ {latency['p50']} с, p95 ≤ {latency['p95']} с")
+        if snap['cache_hit_rate'] is not None:
+            lines.append(f"  попадания в кэш: {snap['cache_hit_rate']:.1%} "
+                         f"({c.get('cache_hits', 0):g} из {c.get('cache_hits', 0) + c.get('cache_misses', 0):g})")
+        return '\n'.join(lines)
+
+
+metrics = Metrics()
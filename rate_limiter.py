@@ -0,0 +1,217 @@
+import random
+import re
+import threading
+import time
+
+# Лимиты по умолчанию для одного API-ключа Gemini (запросов и токенов в минуту).
+# Реальные значения зависят от тарифа: https://ai.google.dev/gemini-api/docs/rate-limits
+DEFAULT_RPM = 60
+DEFAULT_TPM = 1_000_000
+
+# Экспоненциальная пауза после 429 подряд: 1, 2, 4, ... секунд (не больше BACKOFF_MAX),
+# реальная пауза — случайная в [d/2, d], чтобы потоки не просыпались одновременно
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Если 429 не было дольше этого, серия считается законченной и пауза снова с BACKOFF_BASE
+BACKOFF_RESET = 120.0
+
+# Параллельность запросов (AIMD, см. AdaptiveConcurrency): с чего начинаем и верхний предел
+INITIAL_CONCURRENCY = 4
+MAX_CONCURRENCY = 16
+# Задержка ответа выше базовой во столько раз считается признаком перегрузки
+LATENCY_TOLERANCE = 2.0
+
+# Подсказка о задержке в ответе 429: "retryDelay": "37s", "Retry-After: 12" и т.п.
+_retry_delay_pattern = re.compile(r'retry[-_ ]?(?:delay|after)[\'"]?\s*[:=]\s*[\'"]?(\d+(?:\.\d+)?)', re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка количества токенов в строке (~4 символа на токен)."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """Проверяет, похоже ли исключение на превышение квоты (HTTP 429)."""
+    s = str(e).lower()
+    return '429' in s or 'too many requests' in s or 'resource_exhausted' in s or 'rate limit' in s or 'quota' in s
+
+
+def retry_delay_from_error(e: Exception):
+    """Достаёт из текста ошибки рекомендованную сервером задержку в секундах (или None)."""
+    m = _retry_delay_pattern.search(str(e))
+    return float(m.group(1)) if m else None
+
+
+def backoff_delay(strikes: int, retry_after=None) -> float:
+    """Пауза после strikes-го подряд 429: экспонента с джиттером,
+    но не меньше подсказки сервера (Retry-After / retryDelay) с небольшим разбросом.
+    """
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, strikes - 1))
+    delay = random.uniform(ceiling / 2, ceiling)
+    if retry_after:
+        delay = max(delay, retry_after * random.uniform(1.0, 1.1))
+    return delay
+
+
+class _Bucket:
+    """Токен-бакет, пополняющийся равномерно: per_minute единиц за 60 секунд."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # Запрос больше ёмкости бакета пропускаем, как только бакет полон
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+
+class RateLimiter:
+    """Общий ограничитель запросов к API: следит сразу за RPM и TPM.
+    Потокобезопасен — один экземпляр делят все рабочие потоки, работающие с одним ключом.
+    """
+
+    def __init__(self, requests_per_minute: float = DEFAULT_RPM, tokens_per_minute: float = DEFAULT_TPM):
+        self._lock = threading.Lock()
+        self._blocked_until = 0.0
+        self._strikes = 0
+        self._last_penalty = 0.0
+        self.set_limits(requests_per_minute, tokens_per_minute)
+
+    def set_limits(self, requests_per_minute: float, tokens_per_minute: float):
+        with self._lock:
+            self._requests = _Bucket(requests_per_minute)
+            self._tokens = _Bucket(tokens_per_minute)
+
+    def acquire(self, tokens: int = 0, cancel: threading.Event | None = None) -> bool:
+        """Блокирует поток, пока квота не позволит отправить запрос на tokens входных токенов.
+        Если передан cancel и он установлен во время ожидания, возвращает False без списания квоты.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._requests.refill(now)
+                self._tokens.refill(now)
+                delay = max(
+                    self._blocked_until - now,
+                    self._requests.wait_time(1),
+                    self._tokens.wait_time(tokens),
+                )
+                if delay <= 0:
+                    self._requests.level -= 1
+                    self._tokens.level -= min(tokens, self._tokens.capacity)
+                    return True
+            if cancel is None:
+                time.sleep(delay)
+            elif cancel.wait(delay):
+                return False
+
+    def penalize(self, retry_after=None) -> float:
+        """Реакция на 429: опустошаем бакеты (дальше идём строго в темпе квоты)
+        и не пускаем запросы в течение паузы backoff_delay — она растёт с каждым 429 подряд
+        и не меньше подсказки сервера. 429 на запросы, отправленные до начала текущей паузы,
+        серию не удлиняют. Возвращает, сколько секунд осталось до снятия блокировки.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            self._requests.level = min(self._requests.level, 0.0)
+            self._tokens.level = min(self._tokens.level, 0.0)
+            if now - self._last_penalty > BACKOFF_RESET:
+                self._strikes = 0
+            self._last_penalty = now
+            if now >= self._blocked_until:
+                self._strikes += 1
+                self._blocked_until = now + backoff_delay(self._strikes, retry_after)
+            elif retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            return self._blocked_until - now
+
+    def on_success(self):
+        """Успешный ответ: серия 429 закончилась, следующая пауза снова начнётся с BACKOFF_BASE."""
+        with self._lock:
+            self._strikes = 0
+
+
+class AdaptiveConcurrency:
+    """Число одновременных запросов, подстраиваемое по AIMD.
+    Успешный ответ с обычной задержкой прибавляет 1/limit (около +1 за «окно» запросов),
+    429 уменьшает предел вдвое — не чаще раза за время ответа, чтобы волна 429
+    от уже отправленных параллельных запросов не обрушила его до единицы.
+    Рост задержки выше LATENCY_TOLERANCE × базовой останавливает разгон.
+    Занятые места (acquire_slot/release_slot) считаются на весь процесс: несколько
+    одновременных потоков батчей (например, по одному на язык) делят одно окно.
+    Потокобезопасен, как и RateLimiter.
+    """
+
+    def __init__(self, initial: int = INITIAL_CONCURRENCY, maximum: int = MAX_CONCURRENCY, minimum: int = 1):
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self.active = 0
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self._baseline = None
+        self._last_decrease = 0.0
+
+    def current(self, cap: int | None = None) -> int:
+        """Сколько запросов можно держать в работе сейчас (не больше cap)."""
+        value = max(self.minimum, int(self.limit))
+        return max(1, min(value, cap)) if cap is not None else value
+
+    def acquire_slot(self, cap: int | None = None, block: bool = True) -> bool:
+        """Занимает место в окне, если в работе меньше current(cap) запросов.
+        block=True — ждёт освобождения места, иначе сразу возвращает False.
+        """
+        with self._lock:
+            while self.active >= self.current(cap):
+                if not block:
+                    return False
+                self._slot_freed.wait()
+            self.active += 1
+            return True
+
+    def release_slot(self):
+        with self._lock:
+            self.active = max(0, self.active - 1)
+            self._slot_freed.notify_all()
+
+    def on_success(self, latency: float):
+        """Успешный ответ с задержкой latency, секунды. Чтобы базовая задержка была сравнимой,
+        сюда передаются ответы запросов одного размера (полноразмерных батчей, см. batch_requests.LATENCY_KINDS).
+        """
+        with self._lock:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            else:
+                # Базовая задержка медленно подтягивается к текущей (сервер мог стать медленнее)
+                self._baseline = 0.95 * self._baseline + 0.05 * latency
+            if latency > self._baseline * LATENCY_TOLERANCE:
+                return
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._slot_freed.notify_all()
+
+    def on_rate_limited(self) -> bool:
+        """Возвращает True, если предел действительно уменьшен."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_decrease < max(1.0, self._baseline or 0.0):
+                return False
+            self._last_decrease = now
+            self.limit = max(float(self.minimum), self.limit / 2)
+            return True
+
+
+# Общий экземпляр на процесс: все вызовы API в скриптах проходят через него
+limiter = RateLimiter()
+# Общий на процесс предел параллельных батчей: места в нём занимают batch_translate и потоковый режим
+concurrency = AdaptiveConcurrency()
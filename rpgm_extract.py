@@ -0,0 +1,193 @@
+import hashlib
+import io
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Движок извлечения строк для перевода из файлов rvpacker-txt (maps/other).
+# Все шаблоны компилируются один раз при импорте; каждая строка файла
+# классифицируется за один проход одним объединённым регулярным выражением.
+
+# Утилиты для маскировки управляющих последовательностей (\i[...], \c[...], \\., \\# и т.п.).
+# Литеральные {n} в исходном тексте тоже маскируются, чтобы не спутать их с плейсхолдерами.
+control_pattern = re.compile(r'(\\[A-Za-z]+(?:\[[^\]]*\])?|\\.|\{\d+\})')
+
+# Плейсхолдер {n}: привычный моделям формат строк локализации, занимает 2–3 токена
+# и почти никогда не переводится и не ломается, в отличие от __CTRLn__.
+# Обратная замена — один проход; __CTRLn__ понимается для старых логов.
+# split() с внешней группой даёт [текст, плейсхолдер, n, n_ctrl, текст, ...].
+_placeholder_split = re.compile(r'(\{\s*(\d+)\s*\}|__CTRL(\d+)__)').split
+
+_placeholder_numbers = re.compile(r'\{\s*(\d+)\s*\}').findall
+
+_cyrillic_search = re.compile(r"[\u0400-\u04FF]").search
+
+# ShowText(["..."]) с поддержкой экранированных кавычек — общая часть для всех категорий
+_SHOW_TEXT = r'(\s*)ShowText\(\["((?:\\"|[^"])*)"\]\)'
+
+# maps: сначала ShowText, иначе диалог вида "Speaker:\#text"
+_maps_line = re.compile(r'^(?:' + _SHOW_TEXT + r'|(.*?:\\#)(.*))')
+# other: сначала ShowText, иначе любая строка с буквами/цифрами (отступ + тело)
+_other_line = re.compile(r'^(?:' + _SHOW_TEXT + r'|(\s*)(.*[A-Za-z0-9].*))')
+
+
+def mask_control_sequences(s: str):
+    """Заменяет управляющие последовательности плейсхолдерами {0}, {1}, ...
+    Возвращает (маскированная строка, кортеж токенов). Токены интернируются:
+    одинаковые \\c[2] во всех строках игры — один объект.
+    """
+    # Без обратной косой черты и фигурных скобок маскировать нечего
+    if '\\' not in s and '{' not in s:
+        return s, ()
+    tokens: list[str] = []
+
+    def repl(m):
+        tokens.append(sys.intern(m.group(0)))
+        return f"{{{len(tokens)-1}}}"
+
+    masked = control_pattern.sub(repl, s)
+    return masked, tuple(tokens)
+
+
+def unmask_control_sequences(s: str, tokens):
+    """Возвращает управляющие последовательности на место плейсхолдеров за один проход."""
+    if not tokens:
+        return s
+    parts = _placeholder_split(s)
+    if len(parts) == 1:
+        return s
+    count = len(tokens)
+    out = [parts[0]]
+    for j in range(1, len(parts), 4):
+        i = int(parts[j + 1] or parts[j + 2])
+        # Номер вне диапазона (модель выдумала плейсхолдер) оставляем как есть
+        out.append(tokens[i] if i < count else parts[j])
+        out.append(parts[j + 3])
+    return ''.join(out)
+
+
+def placeholders_match(masked: str, translated: str) -> bool:
+    """Перевод содержит ровно те же плейсхолдеры {n}, что и маскированный оригинал (порядок может меняться)."""
+    if '{' not in masked:
+        return '{' not in translated or not _placeholder_numbers(translated)
+    return sorted(map(int, _placeholder_numbers(masked))) == sorted(map(int, _placeholder_numbers(translated)))
+
+
+def is_cyrillic(s: str) -> bool:
+    if s.isascii():
+        return False
+    return _cyrillic_search(s) is not None
+
+
+def extract_entries(all_lines: list[str], category: str) -> list[tuple]:
+    """Находит в строках файла текст для перевода.
+    Возвращает записи (line_idx, kind, prefix, original_text, masked, tokens).
+    """
+    if category == 'maps':
+        matcher = _maps_line.match
+        second_kind = 'maps'
+    elif category == 'other':
+        matcher = _other_line.match
+        second_kind = 'otherline'
+    else:
+        # В прочих категориях переводим только ShowText
+        matcher = _maps_line.match
+        second_kind = None
+
+    entries = []
+    for idx, line in enumerate(all_lines):
+        # Быстрый фильтр: в maps большинство строк — служебные команды без текста
+        if second_kind != 'otherline' and 'ShowText' not in line and ':\\#' not in line:
+            continue
+        m = matcher(line)
+        if m is None:
+            continue
+        show_indent, show_text, prefix, body = m.groups()
+        if show_text is not None:
+            # Записываем тип 'show' для последующей подстановки
+            kind, prefix, original_text = 'show', show_indent, show_text
+        elif second_kind is None:
+            continue
+        else:
+            # 'maps': префикс 'Speaker:\#'; 'otherline': ведущие пробелы, тело без перевода строки
+            kind, original_text = second_kind, body
+        # Пропускаем, если уже русская строка
+        if is_cyrillic(original_text):
+            continue
+        masked, tokens = mask_control_sequences(original_text)
+        entries.append((idx, kind, prefix, original_text, masked, tokens))
+
+    return entries
+
+
+def render_line(kind: str, prefix: str, translated: str) -> str:
+    """Собирает строку файла с переводом для записи вида kind."""
+    if kind == 'show':
+        translated_escaped = translated.replace('"', '\\"')
+        return f'{prefix}ShowText(["{translated_escaped}"])\n'
+    # 'maps' и 'otherline': префикс (Speaker:\# или отступ) + перевод
+    return f'{prefix}{translated}\n'
+
+
+def reassemble_lines(all_lines: list[str], replacements: dict[int, str]) -> list[str]:
+    """Возвращает строки файла, где строки с номерами из replacements заменены.
+    Один проход по файлу: поиск замены — обращение к словарю, а не перебор записей.
+    """
+    if not replacements:
+        return all_lines
+    get = replacements.get
+    return [get(idx, line) for idx, line in enumerate(all_lines)]
+
+
+def read_source(source_path: str) -> tuple[str, list[str]]:
+    """Читает исходный файл один раз: возвращает (sha256 содержимого, строки файла).
+    Строки такие же, как у open(..., encoding='utf-8').readlines() — с переводом \\r\\n в \\n.
+    """
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    return hashlib.sha256(data).hexdigest(), io.StringIO(data.decode('utf-8'), newline=None).readlines()
+
+
+def extract_file(job: tuple) -> dict:
+    """Работник пула: читает файл и находит в нём записи для перевода.
+    job — (source_path, relative_path, output_path, category). Возвращает компактную запись
+    {source_path, relative_path, output_path, sha, entries} без строк файла: их не нужно гонять между процессами.
+    """
+    source_path, relative_path, output_path, category = job
+    sha, all_lines = read_source(source_path)
+    return {
+        'source_path': source_path,
+        'relative_path': relative_path,
+        'output_path': output_path,
+        'sha': sha,
+        'entries': extract_entries(all_lines, category),
+    }
+
+
+def write_file(task: tuple) -> str:
+    """Работник пула: task — (source_path, output_path, replacements).
+    Перечитывает исходный файл, подставляет замены {line_idx: строка} и пишет выходной файл.
+    """
+    source_path, output_path, replacements = task
+    with open(source_path, 'r', encoding='utf-8') as f:
+        all_lines = f.readlines()
+    with open(output_path, 'w', encoding='utf-8') as f_out:
+        f_out.writelines(reassemble_lines(all_lines, replacements))
+    return output_path
+
+
+def map_files(func, items, workers: int | None = None, use_threads: bool = False) -> list:
+    """Применяет func к каждому элементу items в пуле процессов (или потоков при use_threads=True).
+    Результаты возвращаются в порядке items при любом числе работников.
+    workers=None — по числу ядер; при одном работнике пул не создаётся.
+    """
+    items = list(items)
+    workers = min(workers or os.cpu_count() or 1, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    pool_cls = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+    # Крупные порции снижают накладные расходы на передачу задач между процессами
+    chunksize = max(1, len(items) // (workers * 4))
+    with pool_cls(max_workers=workers) as pool:
+        return list(pool.map(func, items, chunksize=chunksize))
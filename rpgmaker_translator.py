@@ -1,9 +1,9 @@
 import os
-import time
 import re
 import subprocess
 import sys
 from google import genai
+from rate_limiter import limiter, estimate_tokens, is_rate_limit_error, retry_delay_from_error
 
 # Глобальная переменная для хранения клиента, чтобы избежать повторной инициализации
 client = None
@@ -107,11 +107,11 @@ def translate_text(text):
         return text # Возвращаем оригинал в случае ошибки
 
     try:
-        # Пауза для соблюдения лимита 60 запросов в минуту
-        time.sleep(4)
-
         prompt = f"Translate the following English text to Russian. Preserve any special characters and formatting like '\\.' or '\\!'. Do not add any extra text, comments, or quotation marks around the translation. Original text: '{text}'"
 
+        # Ждём квоту (RPM/TPM) у общего лимитера вместо фиксированной паузы
+        limiter.acquire(estimate_tokens(prompt))
+
         # Вызов через официальный клиент
         response = client.models.generate_content(
             model='gemini-3-flash-preview',
@@ -123,6 +123,8 @@ def translate_text(text):
         return translated
 
     except Exception as e:
+        if is_rate_limit_error(e):
+            limiter.penalize(retry_delay_from_error(e))
         print(f"  Ошибка при переводе текста '{text}': {e}")
         return text # Возвращаем оригинал в случае ошибки
 
@@ -3,37 +3,47 @@ import time
 import re
 import subprocess
 import sys
-from google import genai
-from google.genai import types
 from pydantic import BaseModel
-import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from translation_backend import GeminiBackend, HttpBackend, FakeBackend
+from rate_limiter import limiter, concurrency, estimate_tokens, is_rate_limit_error, retry_delay_from_error
+from translation_memory import TranslationMemory, MEMORY_FILENAME
+from batch_packer import BatchPacker, DEFAULT_OUTPUT_BUDGET
+from batch_requests import BatchRequester
+from checkpoint import Checkpoint, CHECKPOINT_FILENAME
+from manifest import Manifest, MANIFEST_FILENAME
+from metrics import metrics
+from languages import language_name, parse_languages
+from translation_log import (TranslationLogWriter, LOG_FILENAME, iter_records, missing_indices,
+                             update_records, convert_legacy_log)
+from rpgm_extract import (unmask_control_sequences, extract_entries, render_line, reassemble_lines, read_source,
+                          extract_file, write_file, map_files)
+
+# Бэкенд перевода (см. translation_backend.py): GeminiBackend, HttpBackend или FakeBackend.
+# Глобальный, чтобы не создавать клиента повторно
+backend = None
+
+# Модель и целевой язык перевода по умолчанию (коды языков — см. languages.py).
+# PROMPT_VERSION нужно увеличивать при изменении инструкций батча — от него зависит ключ в памяти переводов.
+MODEL_NAME = 'gemini-3-flash-preview'
+TARGET_LANG = 'ru'
+PROMPT_VERSION = 3
+
+# Совмещённые запросы на несколько языков (process_files_multi, combine=True): выходной бюджет
+# батча делится между языками запроса, и на каждый должно приходиться не меньше стольких токенов
+MIN_LANGUAGE_OUTPUT_BUDGET = 8000
+
+# Верхний предел батчей в работе одновременно; фактическое окно подбирает
+# rate_limiter.concurrency (AIMD) по 429 и задержкам ответов
+MAX_IN_FLIGHT = 16
+
+# Повторы после 429 и ошибок, досылка недостающих индексов и отдельные запросы на строку —
+# в batch_requests.py (общие с GUI main.py)
+
+# Число работников для чтения/разбора и записи файлов (None — по числу ядер)
+FILE_WORKERS = None
 
-# Глобальная переменная для хранения клиента, чтобы избежать повторной инициализации
-client = None
-
-# Утилиты для маскировки управляющих последовательностей (\i[...], \c[...], \\., \\# и т.п.)
-control_pattern = re.compile(r'(\\[A-Za-z]+(?:\[[^\]]*\])?|\\.)')
-
-
-def mask_control_sequences(s: str):
-    tokens: list[str] = []
-
-    def repl(m):
-        tokens.append(m.group(0))
-        return f"__CTRL{len(tokens)-1}__"
-
-    masked = control_pattern.sub(repl, s)
-    return masked, tokens
-
-
-def unmask_control_sequences(s: str, tokens: list[str]):
-    for i, t in enumerate(tokens):
-        s = s.replace(f"__CTRL{i}__", t)
-    return s
-
-
-def is_cyrillic(s: str) -> bool:
-    return bool(re.search(r"[\u0400-\u04FF]", s))
 
 def install_dependencies():
     """Устанавливает зависимости из requirements.txt, если они еще не установлены."""
@@ -47,110 +57,110 @@ def install_dependencies():
         print("Библиотеки успешно установлены.")
 
 
-def batch_translate(all_texts: list[str], batch_sz: int = 10000) -> list[str]:
-    """Переводит список маскированных строк пакетами.
+def _batch_instruction(target_lang: str) -> str:
+    """Инструкция батчевого запроса на один язык (для ru — та же, что до появления выбора языка)."""
+    return (
+        f"Translate the following list of English text entries to {language_name(target_lang)}. "
+        "Placeholders in curly braces such as {0}, {1} stand for game control codes: keep every placeholder exactly as written and place it where it belongs in the translation. "
+        "Preserve any other markup or tags (do NOT translate or modify these tokens). "
+        "Each entry is given as 'index: text'. Return one item per entry with its original numeric index and its translation. "
+        "Do not add extra commentary, numbering, or surrounding quotation marks.\n\n"
+    )
+
+
+def _multi_instruction(languages: list[str]) -> str:
+    """Инструкция совмещённого запроса сразу на несколько языков (см. BatchRequester.request_multi)."""
+    language_list = ', '.join(f'{code} ({language_name(code)})' for code in languages)
+    return (
+        f"Translate the following list of English text entries into each of these languages: {language_list}. "
+        "Placeholders in curly braces such as {0}, {1} stand for game control codes: keep every placeholder exactly as written and place it where it belongs in the translation. "
+        "Preserve any other markup or tags (do NOT translate or modify these tokens). "
+        "Each entry is given as 'index: text'. Return one item per entry with its original numeric index and a list of its translations, "
+        "one per language, each marked with the language code given above. "
+        "Do not add extra commentary, numbering, or surrounding quotation marks.\n\n"
+    )
+
+
+def _single_prompt(text: str, target_lang: str) -> str:
+    """Запрос на одну строку (отдельный перевод упрямой строки, см. BatchRequester.translate_single)."""
+    return (
+        f"Translate the following English text to {language_name(target_lang)}. "
+        "Placeholders in curly braces such as {0}, {1} stand for game control codes; "
+        "keep every placeholder exactly as written, do not add or remove any. "
+        "Reply with the translation only, without commentary or surrounding quotation marks.\n\n"
+        f"Text: {text}"
+    )
+
+
+def _requester() -> BatchRequester:
+    """Запросы через текущий бэкенд и модель (backend задаётся после импорта, см. configure_backend)."""
+    return BatchRequester(backend, MODEL_NAME, _batch_instruction, _single_prompt, multi_instruction=_multi_instruction)
+
+
+def batch_translate(all_texts: list[str], batch_sz: int = 10000, max_in_flight: int = MAX_IN_FLIGHT,
+                    packer: BatchPacker = None, on_batch_done=None, target_lang=TARGET_LANG) -> list:
+    """Переводит список маскированных строк пакетами на язык target_lang.
+    Батчи набираются BatchPacker по бюджету токенов (batch_sz — лишь верхний предел
+    числа строк), бюджет подстраивается по обрезанным и неудачным ответам.
+    Одновременно в работе держится столько батчей, сколько разрешает concurrency
+    (AIMD по 429 и задержкам, не больше max_in_flight); места в окне общие для всего процесса,
+    поэтому параллельные вызовы (например, по одному на язык) делят одну квоту.
+    Результаты раскладываются по глобальным индексам, поэтому порядок сохраняется.
+    on_batch_done(pairs) вызывается в потоке, вызвавшем batch_translate, для каждого завершённого батча
+    со списком пар (текст, перевод) — например, для записи контрольной точки.
     Возвращает список переводов в том же порядке, что и входной список.
+    target_lang — список кодов: совмещённые запросы (BatchRequester.request_multi), выходной бюджет батча
+    делится между языками, а вместо строк возвращаются словари {язык: перевод}.
     """
+    languages = list(target_lang) if isinstance(target_lang, (list, tuple)) else None
     # подготовим пары (global_idx, text)
     all_with_idx = list(enumerate(all_texts))
-    results_map: dict[int, str] = {}
+    results_map: dict = {}
     i = 0
     total = len(all_with_idx)
-    base_batch = batch_sz
-    current_batch = batch_sz
-    reduced_batch = max(1, base_batch // 2)
-    reduced_counter = 0  # number of upcoming chunks to use reduced batch size
-
-    while i < total:
-        chunk = all_with_idx[i:i+current_batch]
-        instruction = (
-            "Translate the following list of English text entries to Russian. "
-            "Preserve all special formatting tokens and control sequences exactly as they appear, including backslash-escaped sequences such as \\i[...], \\#, \\. and any other markup or tags (do NOT translate or modify these tokens). "
-            "Return a JSON object that maps each original numeric index (as a string) to its translated string, for example: {\"0\": \"...\", \"1\": \"...\"}. "
-            "Do not add extra commentary, numbering, or surrounding quotation marks.\n\n"
-        )
-        contents_payload = instruction + "\n".join(f"{idx}: {text}" for idx, text in chunk)
-
-        attempts = 0
-        success = False
-        saw_429 = False
-        while attempts < 2 and not success:
-            try:
-                response = client.models.generate_content(
-                    model='gemini-3-flash-preview',
-                    contents=contents_payload,
-                )
-                text_response = response.text.strip() if hasattr(response, 'text') else ''
-                try:
-                    j = json.loads(text_response)
-                    if isinstance(j, dict):
-                        for k, v in j.items():
-                            try:
-                                ik = int(k)
-                            except Exception:
-                                continue
-                            results_map[ik] = v
-                        # check all present
-                        if all(idx in results_map for idx, _ in chunk):
-                            success = True
-                            break
-                except Exception:
-                    pass
-
-                lines = [ln.strip() for ln in text_response.splitlines() if ln.strip()]
-                if len(lines) >= len(chunk):
-                    for (idx, _), line in zip(chunk, lines):
-                        results_map[idx] = line
-                    success = True
-                    break
-
-            except Exception as e:
-                s = str(e).lower()
-                if '429' in s or 'too many requests' in s or 'rate' in s:
-                    # rate limited
-                    saw_429 = True
-                    print(f'Получен 429 при батче, ожидаю 60 секунд и попробую снова... (начиная с {i})')
-                    time.sleep(60)
-                    # retry once after delay
-                else:
-                    print(f'Ошибка при переводе батча (начиная с {i}), попытка {attempts+1}: {e}')
-            attempts += 1
-
-        if saw_429 and not success:
-            # second 429 or still failing -> reduce batch size to half of base_batch for next two chunks
-            if reduced_batch < current_batch:
-                print(f'Уменьшаю размер батча с {current_batch} до {reduced_batch} для следующих 2 попыток.')
-                current_batch = reduced_batch
-                reduced_counter = 2
-            else:
-                # cannot reduce further, fallback to per-item
-                pass
-
-        if not success:
-            # fallback: per-item requests
-            for idx, text in chunk:
-                try:
-                    single_resp = client.models.generate_content(
-                        model='gemini-3-flash-preview',
-                        contents=f"Translate to Russian, preserve control tokens exactly: {text}",
-                    )
-                    results_map[idx] = single_resp.text.strip() if hasattr(single_resp, 'text') else text
-                except Exception as e:
-                    print(f'Не удалось перевести элемент {idx} по-отдельности: {e}')
-                    results_map[idx] = text
-
-        # advance by chunk length (was current_batch)
-        i += len(chunk)
-
-        # if we were using reduced batch, decrement counter and possibly restore
-        if reduced_counter > 0:
-            reduced_counter -= 1
-            if reduced_counter == 0:
-                print(f'Восстанавливаю размер батча до базового {base_batch}.')
-                current_batch = base_batch
+    if packer is None:
+        if languages:
+            packer = BatchPacker(output_budget=DEFAULT_OUTPUT_BUDGET // len(languages), max_items=batch_sz)
+        else:
+            packer = BatchPacker(max_items=batch_sz)
+    max_in_flight = max(1, max_in_flight)
+    requester = _requester()
+    # Перевод, которого нет в ответе
+    missing = {} if languages else ''
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight = {}
+        try:
+            while i < total or in_flight:
+                # Дозаполняем окно новыми чанками; без своих батчей в работе ждём, пока освободится место
+                while i < total and concurrency.acquire_slot(max_in_flight, block=not in_flight):
+                    end = packer.take(all_with_idx, i)
+                    chunk = all_with_idx[i:end]
+                    if languages:
+                        fut = pool.submit(requester.request_multi, chunk, i, languages)
+                    else:
+                        fut = pool.submit(requester.translate_chunk, chunk, i, target_lang)
+                    in_flight[fut] = (chunk, packer.estimate_output(chunk))
+                    i = end
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    chunk, estimated_output = in_flight.pop(fut)
+                    concurrency.release_slot()
+                    chunk_results, saw_429, success, truncated, output_tokens = fut.result()
+                    results_map.update(chunk_results)
+                    if on_batch_done is not None:
+                        on_batch_done([(text, chunk_results.get(idx, missing)) for idx, text in chunk])
+
+                    # Подстраиваем бюджет следующих батчей по исходу этого
+                    packer.feedback(truncated, saw_429, success, estimated_output, output_tokens)
+        finally:
+            # При исключении не оставляем занятыми места в общем окне
+            for _ in in_flight:
+                concurrency.release_slot()
 
     # build final list
-    final = [results_map.get(idx, '') for idx, _ in all_with_idx]
+    final = [results_map.get(idx, missing) for idx, _ in all_with_idx]
     return final
 
 def get_source_folder():
@@ -165,16 +175,43 @@ def get_source_folder():
             print(f"Папка найдена: '{folder_path}'")
             return folder_path
 
-def main():
+def main(argv=None):
     """
     Главная функция для запуска скрипта перевода.
     """
-    install_dependencies()
+    parser = argparse.ArgumentParser(description="RPG Maker Game Translator")
+    parser.add_argument('--resume', action='store_true',
+                        help="продолжить прерванный прогон: строки из контрольной точки не отправляются повторно")
+    parser.add_argument('--workers', type=int, default=FILE_WORKERS,
+                        help="число работников для чтения и записи файлов (по умолчанию — по числу ядер)")
+    parser.add_argument('--threads', action='store_true',
+                        help="использовать пул потоков вместо пула процессов для работы с файлами")
+    parser.add_argument('--backend', choices=('gemini', 'http', 'fake'), default='gemini',
+                        help="бэкенд перевода: gemini, локальная HTTP-заглушка или заглушка в процессе")
+    parser.add_argument('--backend-url', default=None,
+                        help="адрес HTTP-заглушки (по умолчанию http://127.0.0.1:8765)")
+    parser.add_argument('--metrics', default=None, metavar='PATH',
+                        help="сохранить метрики прогона: .prom/.txt — формат Prometheus, иначе JSON")
+    parser.add_argument('--langs', default=TARGET_LANG,
+                        help="целевые языки через запятую (например, ru,es,de): игра разбирается один раз, "
+                             "каждый язык пишется в папку <source>_<LANG>")
+    parser.add_argument('--combine', action='store_true',
+                        help="при нескольких языках просить переводы на несколько языков в одном запросе")
+    parser.add_argument('--check', action='store_true',
+                        help="при запуске проверить ключ и сеть запросом списка моделей")
+    args = parser.parse_args(argv)
+    try:
+        languages = parse_languages(args.langs)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.backend == 'gemini':
+        install_dependencies()
     print("RPG Maker Game Translator")
     print("=========================")
 
-    # Настройка Gemini API
-    configure_gemini()
+    # Настройка бэкенда перевода (по умолчанию Gemini API)
+    configure_backend(args.backend, args.backend_url, check=args.check)
 
     source_folder = get_source_folder()
 
@@ -190,13 +227,31 @@ def main():
             print("Невалидный ввод, будут обработаны обе категории: maps и other.")
             categories = ['maps', 'other']
 
-    # Создаем папку для перевода
+    # Создаем папки для перевода: по одной на язык
     parent_dir = os.path.dirname(os.path.abspath(source_folder))
-    translation_folder = os.path.join(parent_dir, f"{os.path.basename(source_folder)}_RU")
-    os.makedirs(translation_folder, exist_ok=True)
-    print(f"Папка для переведенных файлов создана: '{translation_folder}'")
+    targets = {}
+    for lang in languages:
+        translation_folder = os.path.join(parent_dir, f"{os.path.basename(source_folder)}_{lang.upper()}")
+        os.makedirs(translation_folder, exist_ok=True)
+        print(f"Папка для переведенных файлов создана: '{translation_folder}'")
+        targets[lang] = translation_folder
+
+    # Потоковый режим пишет файлы по мере перевода и не держит всю игру в памяти (только для одного языка)
+    streaming = False
+    if len(languages) == 1:
+        try:
+            streaming = input("Использовать потоковый режим (для больших игр)? (y/N): ").strip().lower() == 'y'
+        except Exception:
+            streaming = False
 
-    log_path = process_files(source_folder, translation_folder, categories)
+    if args.resume:
+        print("Режим продолжения: уже переведённые строки из контрольной точки будут пропущены.")
+    if streaming:
+        log_paths = {languages[0]: process_files_streaming(source_folder, targets[languages[0]], categories,
+                                                           resume=args.resume, target_lang=languages[0])}
+    else:
+        log_paths = process_files_multi(source_folder, targets, categories, resume=args.resume,
+                                        workers=args.workers, use_threads=args.threads, combine=args.combine)
 
     print("\nРабота завершена.")
 
@@ -206,30 +261,22 @@ def main():
     except Exception:
         choice = 'n'
     if choice == 'y':
-        if log_path and os.path.exists(log_path):
-            retry_from_log(log_path)
-        else:
-            print('Файл лога не найден, повторная попытка невозможна.')
-
-def process_files(source_dir, output_dir, categories=None):
-    """
-    Собирает все строки ShowText во всех .txt файлах исходной директории,
-    батчит их (по batch_size) и переводит одной/несколькими группами,
-    затем записывает соответствующие выходные файлы в output_dir,
-    сохраняя структуру папок.
-    """
-    # Настройки батчинга — можно менять при больших объёмах
-    # По умолчанию обрабатываем большие группы по 10_000 строк.
-    # При превышении квот (429) сначала попытаемся ещё раз тот же батч через 60s;
-    # если снова 429 — временно уменьшаем батч до половины (5_000) для следующих 2 чанков,
-    # затем восстанавливаем исходный размер.
-    batch_size = 10000
+        for lang, log_path in log_paths.items():
+            if log_path and os.path.exists(log_path):
+                retry_from_log(log_path, target_lang=lang)
+            else:
+                print(f'Файл лога ({lang}) не найден, повторная попытка невозможна.')
 
-    # Словарь: путь -> { all_lines: [...], entries: [(line_idx, indentation, original_text), ...] }
-    files_data: dict[str, dict] = {}
-    texts_to_translate: list[str] = []
+    print()
+    print(metrics.summary())
+    if args.metrics:
+        metrics.write(args.metrics)
+        print(f'Метрики сохранены: {args.metrics}')
 
-    # Сбор всех данных
+def iter_file_jobs(source_dir, output_dir, categories=None):
+    """Генератор: обходит .txt файлы выбранных категорий и отдаёт задания
+    (source_path, relative_path, output_path, category). Папки вывода создаются здесь же.
+    """
     if categories is None:
         categories = ['maps', 'other']
 
@@ -255,248 +302,595 @@ def process_files(source_dir, output_dir, categories=None):
             output_file_path = os.path.join(output_dir, category, rel_inside)
             os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
 
-            with open(source_file_path, 'r', encoding='utf-8') as f:
-                all_lines = f.readlines()
+            yield source_file_path, relative_path, output_file_path, top_component.lower()
 
-            # Немного более надёжный шаблон: не жадный захват текста внутри кавычек,
-            # поддержка экранированных кавычек внутри строки
-            show_text_pattern = re.compile(r'^(\s*)ShowText\(\["((?:\\"|[^"])*)"\]\)')
-            # Для файлов, находящихся в подпапке 'maps', строки формата "Speaker:\#text"
-            is_map_file = top_component.lower() == 'maps'
-            maps_pattern = re.compile(r'^(.*?:\\#)(.*)') if is_map_file else None
 
-            entries = []
-            for idx, line in enumerate(all_lines):
-                # Сначала проверяем ShowText
-                match = show_text_pattern.search(line)
-                if match:
-                    indentation = match.group(1)
-                    original_text = match.group(2)
-                    # Пропускаем, если уже русская строка
-                    if is_cyrillic(original_text):
-                        continue
-                    masked, tokens = mask_control_sequences(original_text)
-                    # Записываем тип 'show' для последующей подстановки
-                    entries.append((idx, 'show', indentation, original_text, masked, tokens))
+def iter_extracted_files(source_dir, output_dir, categories=None, manifest=None):
+    """Генератор: по одному обходит .txt файлы выбранных категорий и отдаёт
+    словарь {source_path, relative_path, output_path, sha, all_lines, entries}.
+    Файлы читаются лениво, поэтому в памяти одновременно держится только текущий.
+    Файлы, не изменившиеся с прошлого прогона по манифесту (manifest), пропускаются.
+    """
+    for source_path, relative_path, output_path, category in iter_file_jobs(source_dir, output_dir, categories):
+        if manifest is not None and manifest.stat_unchanged(relative_path, source_path, output_path):
+            continue
+        sha, all_lines = read_source(source_path)
+        if manifest is not None and manifest.content_unchanged(relative_path, source_path, sha, output_path):
+            continue
+
+        yield {
+            'source_path': source_path,
+            'relative_path': relative_path,
+            'output_path': output_path,
+            'sha': sha,
+            'all_lines': all_lines,
+            'entries': extract_entries(all_lines, category),
+        }
+
+
+def resolve_entries(info: dict, translations: dict[str, str], first_index: int) -> tuple[list[dict], dict[int, str]]:
+    """Сопоставляет записи файла с переводами (маскированный текст -> маскированный перевод).
+    Возвращает записи лога (first_index — глобальный номер первой записи)
+    и замены строк файла {line_idx: новая строка}.
+    """
+    log_records: list[dict] = []
+    replacements: dict[int, str] = {}
+
+    for t_idx, (line_idx, kind, prefix, original_text, masked, tokens) in enumerate(info['entries'], first_index):
+        translated = translations.get(masked, '')
+        # Восстанавливаем управляющие последовательности
+        translated_unmasked = unmask_control_sequences(translated, tokens) if translated else ''
+
+        log_records.append({
+            'index': t_idx,
+            'source_path': info['source_path'],
+            'output_path': info['output_path'],
+            'line_idx': line_idx,
+            'kind': kind,
+            'prefix': prefix,
+            'original': original_text,
+            'masked': masked,
+            'tokens': tokens,
+            'translated': translated_unmasked,
+            'status': 'ok' if translated_unmasked else 'missing',
+        })
+
+        if translated_unmasked:
+            replacements[line_idx] = render_line(kind, prefix, translated_unmasked)
+
+    return log_records, replacements
+
+
+def apply_translations(info: dict, translations: dict[str, str], first_index: int) -> list[dict]:
+    """Подставляет переводы в строки файла (info['all_lines']) и возвращает записи лога."""
+    log_records, replacements = resolve_entries(info, translations, first_index)
+    all_lines = info['all_lines']
+    for line_idx, line in replacements.items():
+        all_lines[line_idx] = line
+    return log_records
+
+
+def process_files(source_dir, output_dir, categories=None, memory_path=None, streaming=False, resume=False,
+                  workers=FILE_WORKERS, use_threads=False, target_lang=TARGET_LANG):
+    """
+    Собирает все строки ShowText во всех .txt файлах исходной директории,
+    батчит их (по бюджету токенов, см. batch_packer.py) и переводит одной/несколькими группами
+    на язык target_lang, затем записывает соответствующие выходные файлы в output_dir,
+    сохраняя структуру папок.
+    Уже известные переводы берутся из памяти переводов (memory_path,
+    по умолчанию translation_memory.sqlite3 в output_dir) и в API не отправляются.
+    Каждый завершённый батч сразу дописывается в контрольную точку
+    (translate_checkpoint.jsonl); при resume=True строки из неё повторно не отправляются.
+    Манифест (translate_manifest.json) хранит хэши исходных файлов: при повторном прогоне
+    неизменённые файлы пропускаются целиком, а строки изменённых находятся в памяти переводов —
+    в API уходят только новые и изменённые строки.
+    Чтение и разбор файлов, а затем запись выходных файлов идут в пуле процессов
+    (workers — число работников, None — по числу ядер; use_threads=True — пул потоков).
+    Результат не зависит от числа работников.
+    Длительности стадий (extract, cache_lookup, translate, write) и счётчики пишутся в metrics.
+    При streaming=True работает потоково (см. process_files_streaming).
+    Возвращает путь к логу переводов (None, если переводить нечего).
+    """
+    if streaming:
+        return process_files_streaming(source_dir, output_dir, categories, memory_path, resume=resume,
+                                       target_lang=target_lang)
+    return process_files_multi(source_dir, {target_lang: output_dir}, categories, memory_path, resume=resume,
+                               workers=workers, use_threads=use_threads)[target_lang]
+
+
+def language_groups(languages: list[str]) -> list[list[str]]:
+    """Делит языки на группы для совмещённых запросов так, чтобы на язык приходилось
+    не меньше MIN_LANGUAGE_OUTPUT_BUDGET выходных токенов батча.
+    """
+    size = max(1, DEFAULT_OUTPUT_BUDGET // MIN_LANGUAGE_OUTPUT_BUDGET)
+    return [languages[i:i + size] for i in range(0, len(languages), size)]
+
+
+def process_files_multi(source_dir, targets: dict[str, str], categories=None, memory_path=None, resume=False,
+                        workers=FILE_WORKERS, use_threads=False, combine=False) -> dict[str, str | None]:
+    """Перевод одной игры сразу на несколько языков: targets — {код языка: папка вывода}.
+    Файлы обходятся, читаются и разбираются (с маскированием) один раз на все языки; у каждого
+    языка свои манифест, контрольная точка, лог и память переводов в его папке (или общая memory_path —
+    ключи памяти и так различаются языком). Батчи разных языков идут одновременно
+    и делят общие лимитер и окно параллельности (rate_limiter.limiter и concurrency), а выходные
+    деревья всех языков записываются одним пулом работников.
+    combine=True — строки, которые нужны сразу нескольким языкам, сначала отправляются совмещёнными
+    запросами (один ответ на несколько языков, группы — language_groups), а то, что в них не пришло,
+    переводят обычные батчи языка.
+    Остальное — как в process_files (он вызывает эту функцию с одним языком).
+    Возвращает {код языка: путь к логу переводов или None, если переводить нечего}.
+    """
+    # Настройки батчинга: размер батча определяется бюджетом токенов (BatchPacker),
+    # batch_size — только верхний предел числа строк в одном запросе.
+    batch_size = 10000
+    languages = list(targets)
+    base_dir = targets[languages[0]]
+    # Метки языков в выводе нужны, только когда их несколько
+    tags = {lang: (f'[{lang.upper()}] ' if len(languages) > 1 else '') for lang in languages}
+
+    def output_path(lang: str, path: str) -> str:
+        # Путь задания считается от папки первого языка; для остальных — тот же путь в их папке
+        return os.path.join(targets[lang], os.path.relpath(path, base_dir)) if lang != languages[0] else path
+
+    # Манифест прошлого прогона у каждого языка свой: неизменённые файлы не читаются и не перезаписываются
+    manifests = {lang: Manifest(os.path.join(targets[lang], MANIFEST_FILENAME), lang, MODEL_NAME, PROMPT_VERSION)
+                 for lang in languages}
+    with metrics.stage('extract'):
+        jobs = []
+        job_languages = []
+        for job in iter_file_jobs(source_dir, base_dir, categories):
+            wanted = [lang for lang in languages
+                      if not manifests[lang].stat_unchanged(job[1], job[0], output_path(lang, job[2]))]
+            if wanted:
+                jobs.append(job)
+                job_languages.append(wanted)
+
+        # Записи файлов в порядке обхода: { source_path, output_path, sha, entries: [(line_idx, kind, prefix, ...), ...] }.
+        # Строки файлов в памяти не держатся — при записи файл перечитывается работником.
+        # Файл читается один раз; языкам достаются копии записи со своим output_path и общими entries.
+        files_data: dict[str, list[dict]] = {lang: [] for lang in languages}
+        for info, wanted in zip(map_files(extract_file, jobs, workers, use_threads), job_languages):
+            for lang in wanted:
+                out = output_path(lang, info['output_path'])
+                if manifests[lang].content_unchanged(info['relative_path'], info['source_path'], info['sha'], out):
+                    continue
+                if lang != languages[0]:
+                    os.makedirs(os.path.dirname(out), exist_ok=True)
+                files_data[lang].append(info if out == info['output_path'] else dict(info, output_path=out))
+        del jobs, job_languages
+    metrics.inc('files_skipped', sum(m.skipped for m in manifests.values()))
+    metrics.inc('files_processed', sum(len(files) for files in files_data.values()))
+
+    translations: dict[str, dict[str, str]] = {}
+    memories: dict[str, TranslationMemory] = {}
+    checkpoints: dict[str, Checkpoint] = {}
+    restored: dict[str, dict[str, str]] = {}
+    pending: dict[str, list[str]] = {}
+    log_paths: dict[str, str | None] = {}
+    for lang in languages:
+        tag = tags[lang]
+        manifest = manifests[lang]
+        if manifest.skipped:
+            print(f'{tag}Файлов без изменений с прошлого прогона (пропущены): {manifest.skipped}.')
+        # Уникальные маскированные строки: одна и та же фраза ("Yes", "Goblin Courtesan:")
+        # отправляется в API один раз, а перевод затем раздаётся всем её вхождениям
+        texts_to_translate: list[str] = []
+        text_ids: dict[str, int] = {}
+        entries_count = 0
+
+        # Сбор всех данных
+        for info in files_data[lang]:
+            for entry in info['entries']:
+                masked = entry[4]
+                if masked not in text_ids:
+                    text_ids[masked] = len(texts_to_translate)
                     texts_to_translate.append(masked)
+            entries_count += len(info['entries'])
+
+        if not texts_to_translate:
+            print(f'{tag}Не найдено строк для перевода во всей папке.')
+            manifest.save()
+            files_data[lang] = []
+            log_paths[lang] = None
+            continue
+
+        metrics.inc('entries', entries_count)
+        metrics.inc('unique_texts', len(texts_to_translate))
+
+        with metrics.stage('cache_lookup'):
+            # Сначала ищем готовые переводы в памяти переводов
+            memory = memories[lang] = TranslationMemory(memory_path or os.path.join(targets[lang], MEMORY_FILENAME))
+            found = translations[lang] = memory.get_many(texts_to_translate, lang, MODEL_NAME, PROMPT_VERSION)
+            print(f'{tag}Строк для перевода: {entries_count}, уникальных: {len(texts_to_translate)}.')
+            print(f'{tag}Найдено в памяти переводов: {len(found)} из {len(texts_to_translate)}.')
+
+            # Контрольная точка: при продолжении берём уже переведённые в прошлом запуске строки
+            checkpoint = checkpoints[lang] = Checkpoint(os.path.join(targets[lang], CHECKPOINT_FILENAME), resume=resume)
+            restored[lang] = {}
+            if resume:
+                restored[lang] = {m: t for m, t in checkpoint.done.items() if m in text_ids and m not in found}
+                found.update(restored[lang])
+                print(f'{tag}Восстановлено из контрольной точки: {len(restored[lang])}.')
+            pending[lang] = [t for t in texts_to_translate if t not in found]
+        metrics.inc('cache_hits', len(found))
+        metrics.inc('cache_misses', len(pending[lang]))
+
+    # Выполняем перевод остальных текстов батчами
+    fresh: dict[str, dict[str, str]] = {lang: {} for lang in pending}
+    with metrics.stage('translate'):
+
+        def translate_group(group: list[str]):
+            if len(group) > 1:
+                # Совмещённые запросы — только для строк, которых не хватает всем языкам группы
+                others = [set(pending[lang]) for lang in group[1:]]
+                common = [t for t in pending[group[0]] if all(t in other for other in others)]
+                if common:
+                    print(f'Совмещённые запросы ({", ".join(group)}): {len(common)} строк. Выполняю батчевые запросы...')
+
+                    def record_group(pairs):
+                        for lang in group:
+                            checkpoints[lang].record([(m, trs.get(lang, '')) for m, trs in pairs])
+
+                    for masked, trs in zip(common, batch_translate(common, batch_size, on_batch_done=record_group,
+                                                                   target_lang=group)):
+                        for lang, tr in trs.items():
+                            fresh[lang][masked] = tr
+                    for lang in group:
+                        pending[lang] = [t for t in pending[lang] if t not in fresh[lang]]
+            # Остальное (и то, что не пришло в совмещённых ответах) — обычными батчами языка
+            for lang in group:
+                if pending[lang]:
+                    print(f'{tags[lang]}Запрошено переводов: {len(pending[lang])}. Выполняю батчевые запросы...')
+                    fresh[lang].update(zip(pending[lang], batch_translate(pending[lang], batch_size,
+                                                                          on_batch_done=checkpoints[lang].record,
+                                                                          target_lang=lang)))
+
+        streams = [lang for lang in languages if pending.get(lang)]
+        groups = language_groups(streams) if combine else [[lang] for lang in streams]
+        if len(groups) == 1:
+            translate_group(groups[0])
+        elif groups:
+            # Батчи языков (групп) идут одновременно, квоту и окно параллельности они делят
+            with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+                for fut in [pool.submit(translate_group, group) for group in groups]:
+                    fut.result()
+
+    for lang, memory in memories.items():
+        translations[lang].update(fresh[lang])
+        memory.put_many(fresh[lang].items(), lang, MODEL_NAME, PROMPT_VERSION)
+        if resume:
+            memory.put_many(restored[lang].items(), lang, MODEL_NAME, PROMPT_VERSION)
+        memory.close()
+
+    # Применяем переводы: логи пишутся здесь по порядку файлов, сами файлы всех языков собирают работники пула
+    with metrics.stage('write'):
+        write_tasks = []
+        log_writers = {}
+        for lang in memories:
+            # Лог записей для возможности повторной обработки (пишется потоково, см. translation_log.py)
+            log_writer = log_writers[lang] = TranslationLogWriter(os.path.join(targets[lang], LOG_FILENAME))
+            for info in files_data[lang]:
+                log_records, replacements = resolve_entries(info, translations[lang], log_writer.count)
+                for rec in log_records:
+                    log_writer.write(rec)
+                write_tasks.append((info['source_path'], info['output_path'], replacements))
+                manifests[lang].record(info['relative_path'], info['source_path'], info['sha'], info['entries'],
+                                       translations[lang])
+        del files_data
+        map_files(write_file, write_tasks, workers, use_threads)
+        # Манифест сохраняем только после записи файлов: иначе при сбое файл сочли бы готовым
+        for lang, log_writer in log_writers.items():
+            manifests[lang].save()
+            log_writer.close()
+            log_paths[lang] = log_writer.path
+    for lang in log_writers:
+        print(f'{tags[lang]}Батчевый перевод всех файлов завершён.')
+        print(f'{tags[lang]}Лог переводов сохранён: {log_paths[lang]}')
+        # Прогон завершён и лог записан — контрольная точка больше не нужна
+        checkpoints[lang].close(remove=True)
+    return log_paths
+
+
+def process_files_streaming(source_dir, output_dir, categories=None, memory_path=None,
+                            max_in_flight: int = MAX_IN_FLIGHT, batch_size: int = 10000, resume: bool = False,
+                            target_lang: str = TARGET_LANG):
+    """Потоковый вариант process_files для больших игр (один язык target_lang).
+    Файлы читаются генератором по одному, строки копятся в буфер и уходят в API,
+    как только набирается батч по бюджету токенов. Выходной файл записывается,
+    как только переведены все его строки, а записи лога сразу дописываются на диск.
+    В памяти держатся только файлы, ожидающие батчей из окна (concurrency, не больше max_in_flight).
+    Неизменённые с прошлого прогона файлы пропускаются по манифесту (см. manifest.py).
+    Завершённые батчи пишутся в контрольную точку; при resume=True её строки не переотправляются.
+    Чтение, перевод и запись здесь перекрываются, поэтому в metrics отдельно считаются только
+    cache_lookup и write, а весь прогон — стадией streaming.
+    """
+    started = time.perf_counter()
+    packer = BatchPacker(max_items=batch_size)
+    memory = TranslationMemory(memory_path or os.path.join(output_dir, MEMORY_FILENAME))
+    checkpoint = Checkpoint(os.path.join(output_dir, CHECKPOINT_FILENAME), resume=resume)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_FILENAME), target_lang, MODEL_NAME, PROMPT_VERSION)
+    requester = _requester()
+    max_in_flight = max(1, max_in_flight)
+    if checkpoint.done:
+        # Переводы прерванного прогона кладём в память переводов, дальше их находит обычный поиск;
+        # словарь контрольной точки не держим всё время прогона
+        memory.put_many(checkpoint.done.items(), target_lang, MODEL_NAME, PROMPT_VERSION)
+        print(f'Восстановлено из контрольной точки: {len(checkpoint.done)}.')
+        checkpoint.done.clear()
+
+    # Файлы, ожидающие переводов: номер -> {info, translations, waiting}
+    pending_files: dict[int, dict] = {}
+    # Маскированный текст -> номера файлов, которые его ждут (строка уже в буфере или в полёте)
+    waiters: dict[str, list[int]] = {}
+    buffer: list[str] = []
+    buffer_in = 0
+    buffer_out = 0
+    next_idx = 0  # глобальный номер строки в запросах
+    stats = {'entries': 0, 'cached': 0, 'requested': 0, 'files': 0}
+
+    log_path = os.path.join(output_dir, LOG_FILENAME)
+    log_writer = TranslationLogWriter(log_path)
+
+    def finalize(file_no: int):
+        # Все строки файла переведены: пишем файл и его записи лога, освобождаем память
+        state = pending_files.pop(file_no)
+        info = state['info']
+        with metrics.stage('write'):
+            for rec in apply_translations(info, state['translations'], log_writer.count):
+                log_writer.write(rec)
+            with open(info['output_path'], 'w', encoding='utf-8') as f_out:
+                f_out.writelines(info['all_lines'])
+            manifest.record(info['relative_path'], info['source_path'], info['sha'], info['entries'], state['translations'])
+        stats['files'] += 1
+
+    def dispatch():
+        # Отправляем накопленный буфер одним батчем
+        nonlocal buffer, buffer_in, buffer_out, next_idx
+        chunk = list(enumerate(buffer, next_idx))
+        next_idx += len(chunk)
+        fut = pool.submit(requester.translate_chunk, chunk, chunk[0][0], target_lang)
+        in_flight[fut] = (chunk, packer.estimate_output(chunk))
+        stats['requested'] += len(chunk)
+        buffer, buffer_in, buffer_out = [], 0, 0
+
+    def collect(block: bool):
+        # Забираем завершённые батчи и раздаём переводы ожидающим файлам
+        if not in_flight:
+            return
+        done, _ = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for fut in done:
+            chunk, estimated_output = in_flight.pop(fut)
+            concurrency.release_slot()
+            chunk_results, saw_429, success, truncated, output_tokens = fut.result()
+            packer.feedback(truncated, saw_429, success, estimated_output, output_tokens)
+
+            resolved = [(text, chunk_results.get(idx, '')) for idx, text in chunk]
+            checkpoint.record(resolved)
+            memory.put_many(resolved, target_lang, MODEL_NAME, PROMPT_VERSION)
+            for masked, tr in resolved:
+                for file_no in waiters.pop(masked, []):
+                    state = pending_files[file_no]
+                    state['translations'][masked] = tr
+                    state['waiting'] -= 1
+                    if state['waiting'] == 0:
+                        finalize(file_no)
+
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        in_flight: dict = {}
+        try:
+            for file_no, info in enumerate(iter_extracted_files(source_dir, output_dir, categories, manifest)):
+                unique = list(dict.fromkeys(entry[4] for entry in info['entries']))
+                stats['entries'] += len(info['entries'])
+                with metrics.stage('cache_lookup'):
+                    translations = memory.get_many(unique, target_lang, MODEL_NAME, PROMPT_VERSION) if unique else {}
+                stats['cached'] += len(translations)
+                missing = [m for m in unique if m not in translations]
+                metrics.inc('cache_hits', len(translations))
+                metrics.inc('cache_misses', len(missing))
+                pending_files[file_no] = {'info': info, 'translations': translations, 'waiting': len(missing)}
+                if not missing:
+                    finalize(file_no)
                     continue
 
-                # Если это файл внутри папки maps, проверяем формат диалога Speaker:\#...
-                if is_map_file and maps_pattern is not None:
-                    m2 = maps_pattern.search(line)
-                    if m2:
-                        prefix = m2.group(1)  # включаем 'Speaker:\#'
-                        original_text = m2.group(2)
-                        if is_cyrillic(original_text):
-                            continue
-                        masked, tokens = mask_control_sequences(original_text)
-                        entries.append((idx, 'maps', prefix, original_text, masked, tokens))
-                        texts_to_translate.append(masked)
-                        continue
-
-                # Для файлов в 'other' — если строка содержит заметный текст (буквы/цифры),
-                # считаем её подлежащей переводу целиком, за исключением управляющих последовательностей.
-                if not is_map_file and top_component.lower() == 'other':
-                    # Игнорируем пустые строки и строки, состоящие только из управляющих символов
-                    if re.search(r'[A-Za-z0-9]', line):
-                        # Сохраняем ведущие пробелы как префикс
-                        m_ws = re.match(r'^(\s*)(.*)$', line)
-                        leading = m_ws.group(1)
-                        body = m_ws.group(2).rstrip('\n')
-                        if is_cyrillic(body):
-                            continue
-                        masked, tokens = mask_control_sequences(body)
-                        # Добавляем как 'otherline' — будем заменять весь body на перевод
-                        entries.append((idx, 'otherline', leading, body, masked, tokens))
-                        texts_to_translate.append(masked)
+                for masked in missing:
+                    if masked in waiters:
+                        # Такая строка уже в буфере или в полёте — просто ждём её перевода
+                        waiters[masked].append(file_no)
                         continue
+                    waiters[masked] = [file_no]
+                    in_cost = packer.input_cost(masked)
+                    out_cost = packer.output_cost(masked)
+                    if buffer and (buffer_in + in_cost > packer.input_budget
+                                   or buffer_out + out_cost > packer.output_budget
+                                   or len(buffer) >= packer.max_items):
+                        # Окно заполнено — ждём освобождения места, прежде чем читать дальше
+                        while not concurrency.acquire_slot(max_in_flight, block=not in_flight):
+                            collect(block=True)
+                        dispatch()
+                    buffer.append(masked)
+                    buffer_in += in_cost
+                    buffer_out += out_cost
+
+                collect(block=False)
+
+            if buffer:
+                while not concurrency.acquire_slot(max_in_flight, block=not in_flight):
+                    collect(block=True)
+                dispatch()
+            while in_flight:
+                collect(block=True)
+        finally:
+            # При исключении не оставляем занятыми места в общем окне
+            for _ in in_flight:
+                concurrency.release_slot()
+
+    memory.close()
+    log_writer.close()
+    manifest.save()
+    checkpoint.close(remove=True)
+    metrics.add_time('streaming', time.perf_counter() - started)
+    metrics.inc('entries', stats['entries'])
+    metrics.inc('files_processed', stats['files'])
+    metrics.inc('files_skipped', manifest.skipped)
+
+    print(f'Строк для перевода: {stats["entries"]}, из памяти переводов: {stats["cached"]}, '
+          f'отправлено в API: {stats["requested"]}, файлов записано: {stats["files"]}, '
+          f'без изменений (пропущено): {manifest.skipped}.')
+    print('Потоковый перевод всех файлов завершён.')
+    print(f'Лог переводов сохранён: {log_path}')
+    return log_path
 
-            files_data[source_file_path] = {
-                'relative_path': relative_path,
-                'output_path': output_file_path,
-                'all_lines': all_lines,
-                'entries': entries,
-            }
-
-    if not texts_to_translate:
-        print('Не найдено строк для перевода во всей папке.')
-        return
-
-    pass
-
-    # Выполняем перевод всех собранных текстов батчами
-    print(f'Запрошено переводов: {len(texts_to_translate)}. Выполняю батчевые запросы...')
-    all_translations = batch_translate(texts_to_translate, batch_size)
-
-    # Лог записей для возможности повторной обработки
-    log_records: list[dict] = []
-
-    # Применяем переводы обратно к файлам
-    t_idx = 0
-    for source_path, info in files_data.items():
-        all_lines = info['all_lines']
-        entries = info['entries']
-        output_path = info['output_path']
-
-        for (line_idx, kind, prefix, original_text, masked, tokens) in entries:
-            translated = all_translations[t_idx] if t_idx < len(all_translations) else ''
-            # Восстанавливаем управляющие последовательности
-            translated_unmasked = unmask_control_sequences(translated, tokens) if translated else ''
-            translated_escaped = translated_unmasked.replace('"', '\\"') if translated_unmasked else ''
-
-            rec = {
-                'index': t_idx,
-                'source_path': source_path,
-                'output_path': output_path,
-                'line_idx': line_idx,
-                'kind': kind,
-                'prefix': prefix,
-                'original': original_text,
-                'masked': masked,
-                'tokens': tokens,
-                'translated': translated_unmasked,
-                'status': 'ok' if translated_unmasked else 'missing',
-            }
-            log_records.append(rec)
-            t_idx += 1
-
-            if kind == 'show':
-                if translated_escaped:
-                    all_lines[line_idx] = f'{prefix}ShowText(["{translated_escaped}"])\n'
-            elif kind == 'maps':
-                if translated_unmasked:
-                    all_lines[line_idx] = f'{prefix}{translated_unmasked}\n'
-            elif kind == 'otherline':
-                if translated_unmasked:
-                    all_lines[line_idx] = f'{prefix}{translated_unmasked}\n'
-
-        # Записываем итоговый файл
-        with open(output_path, 'w', encoding='utf-8') as f_out:
-            f_out.writelines(all_lines)
-
-    print('Батчевый перевод всех файлов завершён.')
-
-    # Сохраняем лог переводов
-    log_path = os.path.join(output_dir, 'translate_log.json')
-    try:
-        with open(log_path, 'w', encoding='utf-8') as lf:
-            json.dump(log_records, lf, ensure_ascii=False, indent=2)
-        print(f'Лог переводов сохранён: {log_path}')
-    except Exception as e:
-        print(f'Не удалось сохранить лог: {e}')
 
-    return log_path
-def configure_gemini():
-    """Запрашивает API ключ и настраивает модель Gemini."""
-    global client
+def configure_gemini(api_key: str | None = None, interactive: bool = True, check: bool = False):
+    """Настраивает бэкенд Gemini. interactive=True — спрашивает ключ (Enter — переменная окружения),
+    иначе берёт api_key, а без него — переменную окружения (GEMINI_API_KEY / GOOGLE_API_KEY читает сам SDK).
+    Список моделей запрашивается только при check=True: запуск не тратит на него лишний запрос,
+    а неверный ключ всё равно проявится ошибкой первого запроса перевода.
+    Без interactive ошибки не перехватываются (их обрабатывает вызывающий, см. batch_runner.py).
+    """
+    global backend
     try:
-        api_key = input("Пожалуйста, введите ваш Google AI API ключ (или нажмите Enter для использования переменной окружения): ")
+        if interactive:
+            api_key = input("Пожалуйста, введите ваш Google AI API ключ (или нажмите Enter для использования переменной окружения): ")
 
         # Создаём клиент. Предпочтительно использовать переменную окружения GEMINI_API_KEY,
         # но разрешаем пользователю ввести ключ вручную для удобства.
-        if api_key and api_key.strip():
-            client = genai.Client(api_key=api_key.strip())
-        else:
-            client = genai.Client()
+        backend = GeminiBackend(api_key.strip() if api_key else None)
 
-        # Простая проверка: запрос версии моделей (легковесный способ проверить подключение)
-        try:
-            _ = client.models.list()
-        except Exception:
-            # Не фатальная ошибка — клиент всё равно создан, но мы информируем пользователя
-            print("Клиент создан, но не удалось получить список моделей (проверьте ключ и сетевое подключение).")
+        # Проверка ключа и сети по требованию: запрос списка моделей
+        if check:
+            backend.check()
 
         print("Клиент Gemini успешно настроен.")
 
     except Exception as e:
+        if not interactive:
+            raise
         print(f"Ошибка при настройке клиента Gemini: {e}")
         print("Пожалуйста, убедитесь, что установлен пакет 'google-genai' и вы используете верный Python-интерпретатор.")
         print("Если конфликтует пакет 'google', удалите его: pip uninstall google")
         sys.exit(1)
 
 
-def retry_from_log(log_path: str, batch_size: int = 2000):
-    """Повторно переводит отсутствующие элементы из лога.
-    Обновляет файлы-вывода и сам лог.
+def configure_backend(name: str, url: str | None = None, api_key: str | None = None, interactive: bool = True,
+                      check: bool = False):
+    """Выбирает бэкенд перевода: 'gemini' (см. configure_gemini), 'http' (локальная заглушка по url)
+    или 'fake' (заглушка в процессе) — последние два для прогонов без сети.
+    check=True — сразу проверить доступность бэкенда.
+    """
+    global backend
+    if name == 'gemini':
+        configure_gemini(api_key, interactive, check)
+        return
+    if name == 'http':
+        backend = HttpBackend(url) if url else HttpBackend()
+        print(f"Используется HTTP-заглушка API: {backend.url}")
+    else:
+        backend = FakeBackend()
+        print("Используется заглушка API в процессе (без сети).")
+    if check:
+        backend.check()
+
+
+def write_lines_atomic(path: str, lines: list[str]):
+    """Записывает файл через временный файл и os.replace: при сбое старая версия остаётся целой."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
+
+
+def retry_from_log(log_path: str, batch_size: int = 2000, target_lang: str = TARGET_LANG, memory_path=None):
+    """Повторно переводит отсутствующие элементы из лога (на язык target_lang — язык папки этого лога).
+    Исправления группируются по выходному файлу: каждый файл читается и атомарно
+    перезаписывается один раз. Сам лог не переписывается — новые переводы
+    дописываются в журнал обновлений, статусы переключаются в индексе (см. translation_log.py).
+    Старый translate_log.json сначала конвертируется в компактный формат.
+    Новые переводы кладутся в память переводов memory_path (по умолчанию — рядом с логом).
     """
     try:
-        with open(log_path, 'r', encoding='utf-8') as lf:
-            records = json.load(lf)
+        if log_path.endswith('.json'):
+            log_path = convert_legacy_log(log_path)
+            print(f'Старый лог сконвертирован: {log_path}')
+        # Индекс статусов говорит, какие записи разбирать; остальные строки лога пропускаются
+        with metrics.stage('retry_load'):
+            missing = list(iter_records(log_path, only=set(missing_indices(log_path))))
     except Exception as e:
         print(f"Не удалось загрузить лог {log_path}: {e}")
         return
 
-    # Собираем записи, которые помечены как missing
-    missing = [r for r in records if r.get('status') != 'ok']
     if not missing:
         print('Нет отсутствующих переводов в логе.')
         return
 
     print(f'Найдено {len(missing)} отсутствующих переводов. Попытка перевода...')
 
-    masked_texts = [r['masked'] for r in missing]
-    translated_masked = batch_translate(masked_texts, batch_size)
+    # Каждую уникальную строку переводим один раз и раздаём перевод всем записям
+    masked_texts = list(dict.fromkeys(r['masked'] for r in missing))
+    with metrics.stage('translate'):
+        translated_unique = batch_translate(masked_texts, batch_size, target_lang=target_lang)
+    by_masked = dict(zip(masked_texts, translated_unique))
+
+    memory = TranslationMemory(memory_path or os.path.join(os.path.dirname(os.path.abspath(log_path)), MEMORY_FILENAME))
+    memory.put_many(by_masked.items(), target_lang, MODEL_NAME, PROMPT_VERSION)
+    memory.close()
 
-    # Применяем переводы по очереди
-    for rec, tr_mask in zip(missing, translated_masked):
+    # Раскладываем переведённые записи по выходным файлам
+    by_file: dict[str, list[dict]] = {}
+    for rec in missing:
+        tr_mask = by_masked[rec['masked']]
         tr_unmasked = unmask_control_sequences(tr_mask, rec.get('tokens', [])) if tr_mask else ''
+        if not tr_unmasked:
+            continue
         rec['translated'] = tr_unmasked
-        rec['status'] = 'ok' if tr_unmasked else 'missing'
+        rec['status'] = 'ok'
+        by_file.setdefault(rec['output_path'], []).append(rec)
 
-        # Записываем в файл-выход
-        out_path = rec['output_path']
-        try:
-            with open(out_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-
-            line_idx = rec['line_idx']
-            kind = rec['kind']
-            prefix = rec['prefix']
-            if kind == 'show':
-                escaped = rec['translated'].replace('"', '\\"') if rec['translated'] else ''
-                if escaped:
-                    lines[line_idx] = f"{prefix}ShowText([\"{escaped}\"])\n"
-            elif kind in ('maps', 'otherline'):
-                if rec['translated']:
-                    lines[line_idx] = f"{prefix}{rec['translated']}\n"
-
-            with open(out_path, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-        except Exception as e:
-            print(f"Не удалось обновить файл {out_path}: {e}")
-
-    # Сохраняем обновлённый лог
+    # Каждый файл: одно чтение, все правки в памяти, одна атомарная запись
+    updated: list[dict] = []
+    with metrics.stage('write'):
+        for out_path, file_records in by_file.items():
+            try:
+                with open(out_path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()
+                replacements = {rec['line_idx']: render_line(rec['kind'], rec['prefix'], rec['translated'])
+                                for rec in file_records}
+                write_lines_atomic(out_path, reassemble_lines(lines, replacements))
+                updated.extend(file_records)
+            except Exception as e:
+                # Файл не обновлён — записи остаются missing
+                for rec in file_records:
+                    rec['status'] = 'missing'
+                print(f"Не удалось обновить файл {out_path}: {e}")
+    metrics.inc('retry_recovered', len(updated))
+
+    # Дописываем новые переводы и статусы в лог
     try:
-        with open(log_path, 'w', encoding='utf-8') as lf:
-            json.dump(records, lf, ensure_ascii=False, indent=2)
-        print(f'Лог обновлён: {log_path}')
+        update_records(log_path, updated)
+        print(f'Лог обновлён: переведено {len(updated)} из {len(missing)} ({log_path})')
     except Exception as e:
         print(f'Не удалось сохранить обновлённый лог: {e}')
 
 def translate_text(text):
     """Отправляет текст в Gemini API и возвращает перевод, соблюдая RPM."""
-    global client
-    if not client:
-        print("Ошибка: клиент Gemini не был инициализирован.")
+    if not backend:
+        print("Ошибка: бэкенд перевода не был инициализирован.")
         return text # Возвращаем оригинал в случае ошибки
 
     try:
-        # Пауза для соблюдения лимита 60 запросов в минуту
-        time.sleep(4)
-
         prompt = f"Translate the following English text to Russian. Preserve any special characters and formatting like '\\.' or '\\!'. Do not add any extra text, comments, or quotation marks around the translation. Original text: '{text}'"
 
-        # Вызов через официальный клиент
-        response = client.models.generate_content(
-            model='gemini-3-flash-preview',
-            contents=prompt,
-        )
+        # Ждём квоту (RPM/TPM) у общего лимитера вместо фиксированной паузы
+        limiter.acquire(estimate_tokens(prompt))
 
-        translated = response.text.strip()
+        # Вызов через бэкенд перевода
+        translated = backend.generate(MODEL_NAME, prompt).text.strip()
         print(f"  Переведено: '{text}' -> '{translated}'")
         return translated
 
     except Exception as e:
+        if is_rate_limit_error(e):
+            limiter.penalize(retry_delay_from_error(e))
         print(f"  Ошибка при переводе текста '{text}': {e}")
         return text # Возвращаем оригинал в случае ошибки
 
@@ -551,14 +945,8 @@ def process_single_file(source_path, output_path):
                 # Объединяем входные тексты, разделяем новой строкой и префиксуем нумерацией для устойчивости порядка
                 contents_payload = instruction + "\n".join(f"{i}: {t}" for i, t in enumerate(texts_to_translate))
 
-                response = client.models.generate_content(
-                    model='gemini-3-flash-preview',
-                    contents=contents_payload,
-                    config=types.GenerateContentConfig(
-                        response_mime_type='application/json',
-                        response_schema=Translations,
-                    ),
-                )
+                limiter.acquire(estimate_tokens(contents_payload))
+                response = backend.generate(MODEL_NAME, contents_payload, schema=Translations)
 
                 # Попытка получить парсенный результат
                 parsed = None
@@ -588,20 +976,18 @@ def process_single_file(source_path, output_path):
                     for i in range(len(translations), len(texts_to_translate)):
                         translations.append(texts_to_translate[i])
 
-                # Записываем файл, подставляя переводы на соответствующие позиции
-                for idx, line in enumerate(all_lines):
-                    # Проверяем, есть ли запись для этой строки
-                    found = next((item for item in original_entries if item[0] == idx), None)
-                    if found:
-                        _, indentation, _ = found
-                        translated_text = translations.pop(0)
-                        translated_text_escaped = translated_text.replace('"', '\\"')
-                        new_line = f'{indentation}ShowText(["{translated_text_escaped}"])\n'
-                        f_out.write(new_line)
-                    else:
-                        f_out.write(line)
+                # Записываем файл, подставляя переводы на соответствующие позиции:
+                # записи идут в порядке строк, поэтому переводы сопоставляются zip'ом,
+                # а замены по номеру строки берутся из словаря за один проход
+                replacements = {
+                    line_idx: render_line('show', indentation, translated_text)
+                    for (line_idx, indentation, _), translated_text in zip(original_entries, translations)
+                }
+                f_out.writelines(reassemble_lines(all_lines, replacements))
 
             except Exception as e:
+                if is_rate_limit_error(e):
+                    limiter.penalize(retry_delay_from_error(e))
                 print(f"  Ошибка при батчевом переводе файла {os.path.basename(source_path)}: {e}")
                 # В случае ошибки — записываем оригинал, чтобы не терять данные
                 for line in all_lines:
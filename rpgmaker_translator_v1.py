@@ -1,11 +1,12 @@
 import os
-import time
 import re
 import subprocess
 import sys
 from google import genai
 from google.genai import types
 from pydantic import BaseModel
+from rate_limiter import limiter, estimate_tokens, is_rate_limit_error, retry_delay_from_error
+from rpgm_extract import render_line, reassemble_lines
 
 # Глобальная переменная для хранения клиента, чтобы избежать повторной инициализации
 client = None
@@ -109,11 +110,11 @@ def translate_text(text):
         return text # Возвращаем оригинал в случае ошибки
 
     try:
-        # Пауза для соблюдения лимита 60 запросов в минуту
-        time.sleep(4)
-
         prompt = f"Translate the following English text to Russian. Preserve any special characters and formatting like '\\.' or '\\!'. Do not add any extra text, comments, or quotation marks around the translation. Original text: '{text}'"
 
+        # Ждём квоту (RPM/TPM) у общего лимитера вместо фиксированной паузы
+        limiter.acquire(estimate_tokens(prompt))
+
         # Вызов через официальный клиент
         response = client.models.generate_content(
             model='gemini-3-flash-preview',
@@ -125,6 +126,8 @@ def translate_text(text):
         return translated
 
     except Exception as e:
+        if is_rate_limit_error(e):
+            limiter.penalize(retry_delay_from_error(e))
         print(f"  Ошибка при переводе текста '{text}': {e}")
         return text # Возвращаем оригинал в случае ошибки
 
@@ -178,6 +181,7 @@ def process_single_file(source_path, output_path):
                 # Объединяем входные тексты, разделяем новой строкой и префиксуем нумерацией для устойчивости порядка
                 contents_payload = instruction + "\n".join(f"{i}: {t}" for i, t in enumerate(texts_to_translate))
 
+                limiter.acquire(estimate_tokens(contents_payload))
                 response = client.models.generate_content(
                     model='gemini-3-flash-preview',
                     contents=contents_payload,
@@ -215,20 +219,18 @@ def process_single_file(source_path, output_path):
                     for i in range(len(translations), len(texts_to_translate)):
                         translations.append(texts_to_translate[i])
 
-                # Записываем файл, подставляя переводы на соответствующие позиции
-                for idx, line in enumerate(all_lines):
-                    # Проверяем, есть ли запись для этой строки
-                    found = next((item for item in original_entries if item[0] == idx), None)
-                    if found:
-                        _, indentation, _ = found
-                        translated_text = translations.pop(0)
-                        translated_text_escaped = translated_text.replace('"', '\\"')
-                        new_line = f'{indentation}ShowText(["{translated_text_escaped}"])\n'
-                        f_out.write(new_line)
-                    else:
-                        f_out.write(line)
+                # Записываем файл, подставляя переводы на соответствующие позиции:
+                # записи идут в порядке строк, поэтому переводы сопоставляются zip'ом,
+                # а замены по номеру строки берутся из словаря за один проход
+                replacements = {
+                    line_idx: render_line('show', indentation, translated_text)
+                    for (line_idx, indentation, _), translated_text in zip(original_entries, translations)
+                }
+                f_out.writelines(reassemble_lines(all_lines, replacements))
 
             except Exception as e:
+                if is_rate_limit_error(e):
+                    limiter.penalize(retry_delay_from_error(e))
                 print(f"  Ошибка при батчевом переводе файла {os.path.basename(source_path)}: {e}")
                 # В случае ошибки — записываем оригинал, чтобы не терять данные
                 for line in all_lines:
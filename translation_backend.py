@@ -0,0 +1,311 @@
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from languages import language_code
+
+# Бэкенды перевода. У всех один метод generate(model, contents, schema=None) -> BackendResponse:
+#   GeminiBackend — настоящий Gemini (google-genai)
+#   FakeBackend   — заглушка в процессе: задержка, инъекция 429 и обрезанных ответов
+#   HttpBackend   — клиент локального HTTP-сервера-заглушки (serve_mock, см. __main__)
+# Ошибки 429 у всех бэкендов выглядят одинаково для rate_limiter.is_rate_limit_error
+# и retry_delay_from_error, поэтому ретраи и лимитер работают без изменений.
+
+DEFAULT_MOCK_PORT = 8765
+
+# Строки батчевого запроса имеют вид "index: text"
+_numbered_line = re.compile(r'^(\d+): (.*)$', re.MULTILINE)
+# Целевой язык из инструкции: "... to Russian." / "Translate to Russian, ..."
+_target_language = re.compile(r'\bto ([A-Z][A-Za-z ]*?)[.,:]')
+# ... или кодом: "to the language with code 'de'" (main.py)
+_target_code = re.compile(r"with code '([\w-]+)'")
+# Запрос сразу на несколько языков: "... into each of these languages: ru (Russian), es (Spanish)."
+_language_list = re.compile(r'into each of these languages: ([^\n]+?)\.(?:\s|$)')
+_language_item = re.compile(r'([\w-]+) \(')
+
+
+class BackendResponse:
+    """Ответ бэкенда: текст, разобранный по схеме объект (если есть),
+    признак обрыва по лимиту выходных токенов и число выходных токенов."""
+
+    def __init__(self, text: str, parsed=None, truncated: bool = False, output_tokens: int = 0):
+        self.text = text
+        self.parsed = parsed
+        self.truncated = truncated
+        self.output_tokens = output_tokens
+
+
+class RateLimitError(Exception):
+    """429 от заглушки; текст как у настоящего API, чтобы его распознал rate_limiter."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f'429 RESOURCE_EXHAUSTED: Too Many Requests. Retry-After: {retry_after:g}')
+        self.retry_after = retry_after
+
+
+class GeminiBackend:
+    """Gemini через официальный клиент google-genai."""
+
+    name = 'gemini'
+
+    def __init__(self, api_key: str | None = None):
+        from google import genai
+        from google.genai import types
+        self._types = types
+        self.client = genai.Client(api_key=api_key) if api_key else genai.Client()
+
+    def check(self):
+        """Лёгкая проверка ключа и сети (список моделей); бросает исключение при ошибке."""
+        self.client.models.list()
+
+    def generate(self, model: str, contents: str, schema=None) -> BackendResponse:
+        config = None
+        if schema is not None:
+            config = self._types.GenerateContentConfig(
+                response_mime_type='application/json',
+                response_schema=schema,
+            )
+        response = self.client.models.generate_content(model=model, contents=contents, config=config)
+        try:
+            parsed = response.parsed if schema is not None else None
+        except Exception:
+            parsed = None
+        try:
+            truncated = any('MAX_TOKENS' in str(getattr(c, 'finish_reason', '')) for c in (response.candidates or []))
+        except Exception:
+            truncated = False
+        usage = getattr(response, 'usage_metadata', None)
+        return BackendResponse(
+            text=(response.text or '').strip() if hasattr(response, 'text') else '',
+            parsed=parsed,
+            truncated=truncated,
+            output_tokens=getattr(usage, 'candidates_token_count', 0) or 0,
+        )
+
+
+def fake_translate(text: str, lang: str = 'ru') -> str:
+    """Детерминированный «перевод» заглушки: плейсхолдеры {n} сохраняются как есть."""
+    return f'{lang.upper()}({text})'
+
+
+def _requested_languages(contents: str) -> list[str]:
+    """Коды языков, на которые просит перевести запрос (по умолчанию ru)."""
+    many = _language_list.search(contents)
+    if many:
+        return _language_item.findall(many.group(1))
+    code = _target_code.search(contents)
+    if code:
+        return [code.group(1).lower()]
+    one = _target_language.search(contents)
+    return [(one and language_code(one.group(1))) or 'ru']
+
+
+def _schema_fields(schema) -> list[str]:
+    """Имена полей pydantic-схемы (BatchTranslations -> ['items'], v1 Translations -> ['translations'])."""
+    if schema is None:
+        return []
+    return list(getattr(schema, '__annotations__', {}))
+
+
+class FakeBackend:
+    """Заглушка в процессе для нагрузочных прогонов без сети.
+    latency (+ случайный jitter) — задержка каждого запроса, секунды;
+    rate_limit_rate — доля запросов, получающих 429 (с подсказкой retry_after);
+    rate_limit_every — каждый N-й запрос получает 429 (0 — выключено);
+    truncate_rate — доля батчевых ответов, обрезанных посередине JSON;
+    max_output_items — батч больше этого обрезается всегда (как при лимите выходных токенов);
+    max_concurrency — запрос сверх этого числа одновременных получает 429 (как перегруженный сервер).
+    translate(text, lang) — «перевод» строки; язык берётся из инструкции запроса.
+    Счётчики в stats: requests, items, rate_limited, truncated, peak_concurrency.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limit_rate: float = 0.0,
+                 rate_limit_every: int = 0, retry_after: float = 1.0, truncate_rate: float = 0.0,
+                 max_output_items: int | None = None, max_concurrency: int | None = None,
+                 translate=fake_translate, seed: int | None = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_rate = rate_limit_rate
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.truncate_rate = truncate_rate
+        self.max_output_items = max_output_items
+        self.max_concurrency = max_concurrency
+        self._active = 0
+        self.translate = translate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'items': 0, 'rate_limited': 0, 'truncated': 0, 'peak_concurrency': 0}
+
+    def check(self):
+        pass
+
+    def generate(self, model: str, contents: str, schema=None) -> BackendResponse:
+        return self.generate_fields(contents, _schema_fields(schema))
+
+    def generate_fields(self, contents: str, fields: list[str]) -> BackendResponse:
+        """То же, что generate, но схема задана именами полей (так её передаёт HTTP-заглушка)."""
+        with self._lock:
+            self.stats['requests'] += 1
+            n = self.stats['requests']
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            limited = ((self.rate_limit_every and n % self.rate_limit_every == 0)
+                       or (self.rate_limit_rate and self._random.random() < self.rate_limit_rate))
+            cut = self.truncate_rate and self._random.random() < self.truncate_rate
+            self._active += 1
+            self.stats['peak_concurrency'] = max(self.stats['peak_concurrency'], self._active)
+            if self.max_concurrency is not None and self._active > self.max_concurrency:
+                limited = True
+            if limited:
+                self.stats['rate_limited'] += 1
+        try:
+            if delay:
+                time.sleep(delay)
+        finally:
+            with self._lock:
+                self._active -= 1
+        if limited:
+            raise RateLimitError(self.retry_after)
+
+        languages = _requested_languages(contents)
+        entries = _numbered_line.findall(contents)
+        if not entries:
+            # Одиночный запрос: переводим всё после первого ": "
+            text = contents.split(': ', 1)[-1].strip()
+            with self._lock:
+                self.stats['items'] += 1
+            out = self.translate(text, languages[0])
+            return BackendResponse(text=out, output_tokens=max(1, len(out) // 4))
+
+        if self.max_output_items is not None and len(entries) > self.max_output_items:
+            cut = True
+        if len(languages) > 1:
+            payload = {'items': [{'index': int(idx),
+                                  'translations': [{'lang': lang, 'translation': self.translate(text, lang)}
+                                                   for lang in languages]}
+                                 for idx, text in entries]}
+        else:
+            translated = [(int(idx), self.translate(text, languages[0])) for idx, text in entries]
+            if 'items' in fields:
+                payload = {'items': [{'index': idx, 'translation': tr} for idx, tr in translated]}
+            elif 'translations' in fields:
+                payload = {'translations': [tr for _, tr in translated]}
+            else:
+                payload = {str(idx): tr for idx, tr in translated}
+        text = json.dumps(payload, ensure_ascii=False)
+        if cut:
+            # Как при MAX_TOKENS: JSON оборван, parsed недоступен
+            keep = self.max_output_items if self.max_output_items is not None else len(entries) // 2
+            text = text[:max(1, len(text) * min(keep, len(entries)) // len(entries) - 1)]
+        with self._lock:
+            self.stats['items'] += len(entries)
+            if cut:
+                self.stats['truncated'] += 1
+        return BackendResponse(text=text, truncated=bool(cut), output_tokens=max(1, len(text) // 4))
+
+
+class HttpBackend:
+    """Клиент локальной HTTP-заглушки (serve_mock). Ответ 429 превращается в RateLimitError."""
+
+    name = 'http'
+
+    def __init__(self, url: str = f'http://127.0.0.1:{DEFAULT_MOCK_PORT}', timeout: float = 120.0):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def check(self):
+        with urllib.request.urlopen(self.url + '/health', timeout=self.timeout) as resp:
+            resp.read()
+
+    def generate(self, model: str, contents: str, schema=None) -> BackendResponse:
+        body = json.dumps({'model': model, 'contents': contents, 'fields': _schema_fields(schema)}).encode('utf-8')
+        request = urllib.request.Request(self.url + '/generate', data=body,
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as resp:
+                data = json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError(float(e.headers.get('Retry-After') or 1)) from None
+            raise
+        return BackendResponse(text=data['text'], truncated=data.get('truncated', False),
+                               output_tokens=data.get('output_tokens', 0))
+
+
+def serve_mock(fake: FakeBackend, host: str = '127.0.0.1', port: int = DEFAULT_MOCK_PORT) -> ThreadingHTTPServer:
+    """Создаёт HTTP-сервер-заглушку поверх FakeBackend (запуск — serve_forever()).
+    POST /generate {model, contents, fields} -> {text, truncated, output_tokens} или 429 с Retry-After;
+    GET /health — проверка; GET /stats — счётчики заглушки.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, code: int, payload: dict, headers: dict | None = None):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self._send(200, {'ok': True})
+            elif self.path == '/stats':
+                self._send(200, fake.stats)
+            else:
+                self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/generate':
+                self._send(404, {'error': 'not found'})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+            try:
+                resp = fake.generate_fields(request['contents'], request.get('fields') or [])
+            except RateLimitError as e:
+                self._send(429, {'error': 'RESOURCE_EXHAUSTED', 'retryDelay': f'{e.retry_after:g}s'},
+                           {'Retry-After': f'{e.retry_after:g}'})
+                return
+            self._send(200, {'text': resp.text, 'truncated': resp.truncated, 'output_tokens': resp.output_tokens})
+
+        def log_message(self, format, *args):
+            # Тысячи запросов в секунду — не засоряем вывод
+            pass
+
+    return ThreadingHTTPServer((host, port), Handler)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Локальная HTTP-заглушка API перевода для нагрузочных прогонов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_MOCK_PORT)
+    parser.add_argument('--latency', type=float, default=0.2, help='задержка ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.1, help='случайная добавка к задержке, секунды')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='доля запросов, получающих 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After в ответе 429, секунды')
+    parser.add_argument('--truncate', type=float, default=0.0, help='доля батчевых ответов, обрезанных посередине')
+    parser.add_argument('--max-output-items', type=int, default=None, help='батч больше этого обрезается всегда')
+    parser.add_argument('--max-concurrency', type=int, default=None,
+                        help='запросы сверх этого числа одновременных получают 429')
+    args = parser.parse_args()
+
+    server = serve_mock(FakeBackend(latency=args.latency, jitter=args.jitter, rate_limit_rate=args.rate_limit,
+                                    retry_after=args.retry_after, truncate_rate=args.truncate,
+                                    max_output_items=args.max_output_items, max_concurrency=args.max_concurrency),
+                        args.host, args.port)
+    print(f'Заглушка API слушает http://{args.host}:{args.port} (Ctrl-C — остановить)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
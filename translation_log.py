@@ -0,0 +1,145 @@
+import json
+import os
+
+# Компактный лог переводов. Состоит из трёх файлов:
+#   translate_log.jsonl          — одна строка на запись; пути вынесены в отдельные строки-справочники
+#   translate_log.jsonl.status   — индекс статусов: один байт на запись (b'1' ok, b'0' missing)
+#   translate_log.jsonl.updates.jsonl — переводы, дописанные retry_from_log
+# Строка пути:  {"p": id, "src": source_path, "out": output_path} (пишется перед первой записью с этим путём)
+# Строка записи: [index, path_id, line_idx, kind, prefix, masked, tokens, translated]
+# Исходный текст не хранится: он восстанавливается из masked и tokens.
+LOG_FILENAME = 'translate_log.jsonl'
+STATUS_SUFFIX = '.status'
+UPDATES_SUFFIX = '.updates.jsonl'
+
+STATUS_OK = b'1'
+STATUS_MISSING = b'0'
+
+
+class TranslationLogWriter:
+    """Потоково пишет лог: запись попадает на диск сразу, в памяти держится только справочник путей."""
+
+    def __init__(self, log_path: str):
+        self.path = log_path
+        self._paths: dict[tuple[str, str], int] = {}
+        self.count = 0
+        # Новый лог делает старый журнал обновлений недействительным
+        try:
+            os.remove(log_path + UPDATES_SUFFIX)
+        except OSError:
+            pass
+        self._log = open(log_path, 'w', encoding='utf-8')
+        self._status = open(log_path + STATUS_SUFFIX, 'wb')
+
+    def write(self, rec: dict):
+        key = (rec['source_path'], rec['output_path'])
+        path_id = self._paths.get(key)
+        if path_id is None:
+            path_id = self._paths[key] = len(self._paths)
+            self._log.write(json.dumps({'p': path_id, 'src': key[0], 'out': key[1]}, ensure_ascii=False) + '\n')
+        row = [rec['index'], path_id, rec['line_idx'], rec['kind'], rec['prefix'],
+               rec['masked'], rec['tokens'], rec['translated']]
+        self._log.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._status.write(STATUS_OK if rec['status'] == 'ok' else STATUS_MISSING)
+        self.count += 1
+
+    def close(self):
+        self._log.close()
+        self._status.close()
+
+
+def missing_indices(log_path: str) -> list[int]:
+    """Номера записей со статусом missing — читается только индекс статусов."""
+    with open(log_path + STATUS_SUFFIX, 'rb') as sf:
+        status = sf.read()
+    missing = []
+    pos = status.find(STATUS_MISSING)
+    while pos != -1:
+        missing.append(pos)
+        pos = status.find(STATUS_MISSING, pos + 1)
+    return missing
+
+
+def iter_records(log_path: str, only=None):
+    """Потоково отдаёт записи лога в виде словарей.
+    only — множество номеров записей: строки остальных записей даже не разбираются.
+    Переводы из журнала обновлений и актуальные статусы подставляются.
+    """
+    updates = _load_updates(log_path)
+    with open(log_path + STATUS_SUFFIX, 'rb') as sf:
+        status = sf.read()
+
+    paths: dict[int, tuple[str, str]] = {}
+    index = 0
+    with open(log_path, 'r', encoding='utf-8') as lf:
+        for line in lf:
+            if line.startswith('{'):
+                p = json.loads(line)
+                paths[p['p']] = (p['src'], p['out'])
+                continue
+            if only is not None and index not in only:
+                index += 1
+                continue
+            idx, path_id, line_idx, kind, prefix, masked, tokens, translated = json.loads(line)
+            index = idx + 1
+            source_path, output_path = paths[path_id]
+            yield {
+                'index': idx,
+                'source_path': source_path,
+                'output_path': output_path,
+                'line_idx': line_idx,
+                'kind': kind,
+                'prefix': prefix,
+                'masked': masked,
+                'tokens': tokens,
+                'translated': updates.get(idx, translated),
+                'status': 'ok' if status[idx:idx + 1] == STATUS_OK else 'missing',
+            }
+
+
+def update_records(log_path: str, records: list[dict]):
+    """Сохраняет новые переводы записей: дописывает их в журнал обновлений
+    и переключает байты статуса на месте. Сам лог не переписывается.
+    """
+    if not records:
+        return
+    with open(log_path + UPDATES_SUFFIX, 'a', encoding='utf-8') as uf:
+        for rec in records:
+            uf.write(json.dumps({'i': rec['index'], 't': rec['translated']}, ensure_ascii=False) + '\n')
+        uf.flush()
+        os.fsync(uf.fileno())
+    with open(log_path + STATUS_SUFFIX, 'r+b') as sf:
+        for rec in sorted(records, key=lambda r: r['index']):
+            sf.seek(rec['index'])
+            sf.write(STATUS_OK if rec['status'] == 'ok' else STATUS_MISSING)
+        sf.flush()
+        os.fsync(sf.fileno())
+
+
+def convert_legacy_log(json_path: str) -> str:
+    """Переводит старый translate_log.json (JSON-массив записей; retry_from_log переписывал его целиком,
+    поэтому все исправления уже в нём) в компактный формат рядом с ним. Возвращает путь к новому логу.
+    """
+    with open(json_path, 'r', encoding='utf-8') as lf:
+        records = json.load(lf)
+    new_path = os.path.join(os.path.dirname(os.path.abspath(json_path)), LOG_FILENAME)
+    writer = TranslationLogWriter(new_path)
+    for rec in records:
+        writer.write(rec)
+    writer.close()
+    return new_path
+
+
+def _load_updates(log_path: str) -> dict[int, str]:
+    updates: dict[int, str] = {}
+    updates_path = log_path + UPDATES_SUFFIX
+    if os.path.exists(updates_path):
+        with open(updates_path, 'r', encoding='utf-8') as uf:
+            for line in uf:
+                try:
+                    upd = json.loads(line)
+                except ValueError:
+                    # Недописанная строка после сбоя
+                    continue
+                updates[upd['i']] = upd['t']
+    return updates
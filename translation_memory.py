@@ -0,0 +1,67 @@
+import os
+import sqlite3
+import threading
+
+# Имя файла памяти переводов по умолчанию (кладётся в папку вывода)
+MEMORY_FILENAME = 'translation_memory.sqlite3'
+
+# Сколько строк запрашиваем за один SELECT ... IN (...) (лимит параметров SQLite)
+_LOOKUP_CHUNK = 500
+
+
+class TranslationMemory:
+    """Постоянная память переводов на SQLite.
+    Ключ — (маскированный текст, целевой язык, модель, версия промпта),
+    поэтому смена модели или инструкции не подмешивает старые переводы.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS tm ('
+            ' masked TEXT NOT NULL,'
+            ' lang TEXT NOT NULL,'
+            ' model TEXT NOT NULL,'
+            ' prompt_version INTEGER NOT NULL,'
+            ' translated TEXT NOT NULL,'
+            ' PRIMARY KEY (masked, lang, model, prompt_version))'
+        )
+        self._conn.commit()
+
+    def get_many(self, texts, lang: str, model: str, prompt_version: int) -> dict[str, str]:
+        """Возвращает {маскированный текст: перевод} для найденных в памяти строк."""
+        unique = list(dict.fromkeys(texts))
+        found: dict[str, str] = {}
+        with self._lock:
+            for i in range(0, len(unique), _LOOKUP_CHUNK):
+                part = unique[i:i+_LOOKUP_CHUNK]
+                placeholders = ','.join('?' * len(part))
+                rows = self._conn.execute(
+                    f'SELECT masked, translated FROM tm WHERE lang=? AND model=? AND prompt_version=? AND masked IN ({placeholders})',
+                    (lang, model, prompt_version, *part),
+                )
+                found.update(rows)
+        return found
+
+    def put_many(self, pairs, lang: str, model: str, prompt_version: int):
+        """Сохраняет пары (маскированный текст, перевод); пустые переводы пропускаются."""
+        rows = [(m, lang, model, prompt_version, t) for m, t in pairs if t]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany('INSERT OR REPLACE INTO tm VALUES (?, ?, ?, ?, ?)', rows)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM tm').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()